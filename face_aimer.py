@@ -1,73 +1,110 @@
-import queue
-import threading
+import argparse
+import json
+import os
+from time import perf_counter
 
 import cv2 as cv
-import dlib
 import numpy as np
-from imutils import face_utils
 
-from input_controllers import mouseController, stickController
+from face_tracker import faceTracker
+from flight_recorder import flightRecorder
+from frame_grabber import frameGrabber
+from frame_sources import lumaImage, openFrameSource
+from input_controllers import controllerThread, mouseController, stickController
+from output_backends import makeOutputBackend
+from perf_stats import perf
+from pose_broadcast import posePublisher
+from pose_channel import poseChannel
+from pose_solver import poseSolver
+from preview import hotkeyListener, previewPainter, previewRenderer, previewState
+from quality_governor import qualityGovernor
 from resources.facial_points_3d import model_points
+from screen_mapping import screenMapping
 from settings import face_aimer_settings
+from tracking_pool import trackingPool
 
 class faceAimer():
 
-    def __init__(self):
+    def __init__(self, frame_source=None, preview_mode=None, startup_profile=False):
+        # startup timing, printed once the first frame is tracked
+        self.startup_profile = startup_profile
+        self.startup_stages = []
+        self.startup_time = perf_counter()
+        self.startup_mark = self.startup_time
+        self.startup_done = False
+
         # import settings
         self.control_mode = face_aimer_settings['default_control_mode']
         self.res_x = face_aimer_settings['res_x']
         self.res_y = face_aimer_settings['res_y']
-        self.marker_color = face_aimer_settings['marker_color_bgr']
-        self.gaze_line_color = face_aimer_settings['gaze_line_color_bgr']
-        self.deadzone_color = face_aimer_settings['deadzone_color_bgr']
-        self.landmarks_color = face_aimer_settings['facial_landmarks_color_bgr']
+        self.preview_mode = preview_mode if preview_mode is not None else face_aimer_settings['preview_mode']
+        self.calibration_file = face_aimer_settings['calibration_file']
+        self.camera_cache_file = face_aimer_settings['camera_cache_file']
+        if frame_source is None:
+            frame_source = face_aimer_settings['frame_source']
 
-        # text settings
-        self.show_text = True
-        self.font_face = cv.FONT_HERSHEY_PLAIN
-        self.font_scale = 0.85
-        self.font_color = (0, 0, 0)
-        self.font_thickness = 1
-        self.font_linetype = cv.LINE_AA
+        # preview drawing
+        self.painter = previewPainter()
+        self.renderer = None
+        self.hotkeys = None
 
         # text overlays
-        self.primary_text_position = (10, 10)
+        self.show_text = True
+        self.show_perf = False
+        self.font_scale = self.painter.font_scale
         self.quit_text = "'ESC' to quit"
         self.switch_mode_text = f"'TAB' to switch control modes | {self.control_mode}"
         self.pause_text = "'SPACEBAR' to pause control input"
         self.unpause_text = "'SPACEBAR' to resume control input"
         self.hide_controls_text = "'H' to hide controls"
-        # get size of quit text to calculate additional text positions
-        (_, text_height), _ = cv.getTextSize(self.quit_text, self.font_face, self.font_scale, self.font_thickness)
-        self.secondary_text_position = (self.primary_text_position[0], int(self.primary_text_position[1] + text_height*1.4))
-        self.tertiary_text_position = (self.secondary_text_position[0], int(self.secondary_text_position[1] + text_height*1.4))
-        self.fourth_text_position = (self.tertiary_text_position[0], int(self.tertiary_text_position[1] + text_height*1.4))
+        self.recalibrate_text = "'C' to recalibrate"
+        self.perf_text = "'P' to show performance stats"
+
+        # facial recognition, in worker processes if tracking_workers is set. Otherwise the models load in the background:
+        # dlib holds the GIL while loading, so this only overlaps with calls that let go of it, like opening the camera right after
+        self.tracking_workers = face_aimer_settings['tracking_workers']
+        self.tracker = faceTracker(load_models=False)
+        if not self.tracking_workers:
+            self.tracker.loadModelsInBackground()
+        self.pool = None
+        self.model_points = model_points # 3D facial points
 
-        # open video camera
+        # open video camera, or a recording to replay
         try:
-            self.cap = cv.VideoCapture(0)
+            self.cap = openFrameSource(frame_source, realtime=face_aimer_settings['frame_source_realtime'])
         except:
             print("Cannot acquire camera resource! Quitting...")
             exit(1)
-
-        # facial recognition
-        self.detector = dlib.get_frontal_face_detector()
-        self.predictor = dlib.shape_predictor("resources\shape_predictor_68_face_landmarks.dat")
-        self.model_points = model_points # 3D facial points
+        self.markStartup('open camera')
 
         # camera parameters (default params but could be calibrated)
-        _, frame = self.cap.read()
-        size = frame.shape
-        focal_length = size[1]
-        center = (size[1]/2, size[0]/2)
-        self.camera_matrix = np.array(
-            [[focal_length, 0, center[0]],
-             [0, focal_length, center[1]],
-             [0, 0, 1]],
-            dtype="double")
-
-        # distortion params (assume no distortion)
-        self.dist_coeffs = np.zeros((4, 1))
+        (size, self.camera_matrix, self.dist_coeffs) = self.cameraIntrinsics(frame_source)
+        self.frame_width = size[1]
+        self.frame_height = size[0]
+        self.markStartup('camera intrinsics')
+
+        # frames are read into the same buffer every time. Grayscale alternates between two, optical flow needs the previous one
+        self.frame_buffer = None
+        self.gray_buffers = [np.empty(size, dtype=np.uint8) for _ in range(2)]
+        self.gray_index = 0
+
+        # head pose solver
+        self.solver = poseSolver(self.camera_matrix, self.dist_coeffs)
+
+        # trades tracking & preview quality for time when frames go over budget
+        self.governor = None
+        if face_aimer_settings['frame_budget_ms']:
+            self.governor = qualityGovernor(self.tracker)
+
+        if self.tracking_workers:
+            self.pool = trackingPool(self.tracking_workers, size)
+
+        # read the camera on its own thread so tracking always gets the newest frame
+        self.grabber = None
+        if face_aimer_settings['threaded_capture']:
+            self.grabber = frameGrabber(self.cap)
+            self.grabber.start()
+        self.frame_time = 0
 
         # coordinate smoothing
         self.last_1 = (0, 0)
@@ -83,50 +120,197 @@ class faceAimer():
         self.pose_height = 0
         self.pose_center = (0, 0)
 
-        # init opencv window
-        cv.namedWindow('Face Aimer', cv.WINDOW_NORMAL)
-        # spawn the window on top of other windows
-        cv.setWindowProperty('Face Aimer', cv.WND_PROP_TOPMOST, 1)
+        if self.preview_mode != 'headless':
+            # init opencv window
+            cv.namedWindow('Face Aimer', cv.WINDOW_NORMAL)
+            # spawn the window on top of other windows
+            cv.setWindowProperty('Face Aimer', cv.WND_PROP_TOPMOST, 1)
+            self.markStartup('window')
+
+        # the workers have been loading their models since the pool started
+        if self.pool is not None:
+            if not self.pool.waitReady():
+                print("Tracking workers didn't start in time, frames may be dropped until they do")
+            self.markStartup('tracking workers')
 
         # pause
         self.paused = False
-        # create event to stop controllers
-        self.stop_controller_event = threading.Event()
+        self.controller_thread = None
+
+        # last solved head pose & the landmarks it was solved from
+        self.rot_vect = None
+        self.trans_vect = None
+        self.landmarks = None
+
+        # flight recorder & pose broadcast, opened by run()
+        self.recorder = None
+        self.publisher = None
 
         return
 
-    def calibrate(self):
+    def markStartup(self, stage):
+        # record how long a startup stage took since the last one
+        now = perf_counter()
+        self.startup_stages.append((stage, now - self.startup_mark))
+        self.startup_mark = now
+
+    def startupStats(self):
+        stats = f"Startup: first frame tracked {(self.startup_mark - self.startup_time)*1000:.0f} ms after launch"
+        for (stage, duration) in self.startup_stages:
+            stats += f"\n  {stage}: {duration*1000:.0f} ms"
+        if self.tracker.model_load_time:
+            stats += (f"\n  models loaded in {self.tracker.model_load_time*1000:.0f} ms in the background, "
+                      f"tracking waited {self.tracker.model_wait_time*1000:.0f} ms for them")
+        return stats
+
+    def finishStartup(self):
+        # called when the first frame has been tracked
+        self.startup_done = True
+        self.markStartup('first frame tracked')
+        if self.startup_profile:
+            print(self.startupStats())
+
+    def cameraIntrinsics(self, frame_source):
+        # returns (frame size, camera matrix, distortion coefficients)
+        # cameras are cached per device & resolution so startup doesn't have to wait for a probe frame. Swap in a real calibration there if you have one
+        cache = {}
+        cache_key = None
+        if self.camera_cache_file and (isinstance(frame_source, int) or str(frame_source).isdigit()):
+            width = int(self.cap.get(cv.CAP_PROP_FRAME_WIDTH))
+            height = int(self.cap.get(cv.CAP_PROP_FRAME_HEIGHT))
+            if width and height:
+                cache_key = f"camera {int(frame_source)} {width}x{height}"
+                if os.path.exists(self.camera_cache_file):
+                    with open(self.camera_cache_file) as f:
+                        cache = json.load(f)
+                if cache_key in cache:
+                    intrinsics = cache[cache_key]
+                    return ((height, width), np.array(intrinsics['camera_matrix'], dtype="double"),
+                            np.array(intrinsics['dist_coeffs'], dtype="double").reshape(-1, 1))
+
+        # probe a frame for the size
+        _, frame = self.cap.read()
+        size = frame.shape[:2]
+        focal_length = size[1]
+        center = (size[1]/2, size[0]/2)
+        camera_matrix = np.array(
+            [[focal_length, 0, center[0]],
+             [0, focal_length, center[1]],
+             [0, 0, 1]],
+            dtype="double")
+
+        # distortion params (assume no distortion)
+        dist_coeffs = np.zeros((4, 1))
+
+        if cache_key is not None:
+            cache[cache_key] = {'camera_matrix': camera_matrix.tolist(), 'dist_coeffs': dist_coeffs.ravel().tolist()}
+            with open(self.camera_cache_file, 'w') as f:
+                json.dump(cache, f, indent=4)
+
+        return (size, camera_matrix, dist_coeffs)
+
+    def calibrate(self, reuse=True):
+        # skip calibrating if we've done it before with the same camera & solver settings
+        if reuse and self.calibration_file and os.path.exists(self.calibration_file):
+            if self.loadCalibration(self.calibration_file):
+                print(f"Loaded calibration from {self.calibration_file}")
+                return
+            print(f"{self.calibration_file} was made with a different camera, resolution or solver settings, calibrating again")
+
         # keep track of which stage of calibration
         calibrating = True
         stage = 0
         calibration_positions = ['top left', 'top right', 'bottom right', 'bottom left']
         calibration_points = []
+        prompted_stage = -1
+
+        # each corner is averaged over several frames, samples is None until spacebar starts collecting them
+        sample_count = face_aimer_settings['calibration_samples']
+        samples = None
+        sampled_frames = 0
 
         while calibrating:
-            _, frame = self.cap.read()
-            frame = cv.flip(frame, 1)
-            cv.putText(frame, self.quit_text,
-                       self.primary_text_position, self.font_face, self.font_scale, self.font_color, self.font_thickness, self.font_linetype)
-            cv.putText(frame, f"CALIBRATING: Point your nose at the {calibration_positions[stage]} corner of your monitor, then press spacebar...",
-                       self.secondary_text_position, self.font_face, self.font_scale*0.90, self.font_color, self.font_thickness, self.font_linetype)
-            cv.imshow('Face Aimer', frame)
-
-            # if spacebar is pressed, move to next stage
-            key = cv.waitKey(1)
-            if key == 32:
-                calibration_point = self.trackFace(frame)[1]
-                if calibration_point == (-1, -1):
-                    print("COULDN'T FIND FACE, TRY AGAIN")
+            frame = self.readFrame()
+
+            if samples is not None:
+                # collecting the corner, track every frame until there are enough poses
+                sampled_frames += 1
+                if self.pool is None:
+                    pose_point = self.trackFace(frame)[1]
                 else:
-                    calibration_points.append(calibration_point)
-                    if stage == 3:
-                        calibrating = False
+                    tracked = self.trackFacePooled(frame, block=True)
+                    pose_point = (-1, -1) if tracked is None else tracked[1]
+                if pose_point != (-1, -1):
+                    samples.append(pose_point)
+
+                if len(samples) >= sample_count:
+                    calibration_point = self.averageCorner(samples)
+                    samples = None
+                    if calibration_point is None:
+                        print("TOO MUCH MOVEMENT, HOLD STILL AND TRY AGAIN")
                     else:
-                        stage += 1
+                        calibration_points.append(calibration_point)
+                        if stage == 3:
+                            calibrating = False
+                        else:
+                            stage += 1
+                elif sampled_frames >= sample_count*2:
+                    # lost the face on too many of the frames
+                    samples = None
+                    print("COULDN'T FIND FACE, TRY AGAIN")
+
+            if self.preview_mode == 'headless':
+                # prompt on the console instead
+                if prompted_stage != stage:
+                    print(f"CALIBRATING: Point your nose at the {calibration_positions[stage]} corner of your monitor, "
+                          f"then press {face_aimer_settings['headless_hotkeys']['pause']}...")
+                    prompted_stage = stage
+            else:
+                calibration_text = f"CALIBRATING: Point your nose at the {calibration_positions[stage]} corner of your monitor, then press spacebar..."
+                if samples is not None:
+                    calibration_text = f"CALIBRATING: Hold still on the {calibration_positions[stage]} corner..."
+                # only the text is drawn without landmarks
+                state = previewState(frame, None, (-1, -1), (-1, -1), (0, 0), self.control_mode, 0,
+                                     ((self.quit_text, self.font_scale), (calibration_text, self.font_scale*0.90)), (), ())
+                if self.renderer is not None:
+                    # recalibrating with the threaded preview, it owns the window
+                    self.renderer.update(state)
+                else:
+                    cv.imshow('Face Aimer', self.painter.draw(state))
+
+            # if spacebar is pressed, start sampling this corner
+            key = self.getKey()
+            if key == 32 and samples is None and calibrating:
+                samples = []
+                sampled_frames = 0
             # if esc key pressed, quit
             elif key == 27:
                 self.shutdown()
 
+        self.setCalibration(calibration_points)
+        if self.calibration_file:
+            self.saveCalibration(self.calibration_file)
+
+        return
+
+    def averageCorner(self, samples):
+        # average the corner's pose points, leaving out ones far from the median. None if too many had to go
+        points = np.array(samples, dtype=np.float64)
+        median = np.median(points, axis=0)
+        distances = np.linalg.norm(points - median, axis=1)
+        limit = max(3*np.median(distances), 1.0)
+        kept = points[distances <= limit]
+        if len(kept) < len(points)/2:
+            return None
+        return tuple(kept.mean(axis=0).tolist())
+
+    def setCalibration(self, calibration_points, homography=None):
+        # corner pose points: top left, top right, bottom right, bottom left
+        self.calibration_points = calibration_points
+
+        # pose to screen mapping, the homography is computed from the corners unless it's given
+        self.screen_mapping = screenMapping(calibration_points, self.res_x, self.res_y, homography)
+
         # set bounds
         self.x_min = min(calibration_points[0][0], calibration_points[3][0])
         self.x_max = max(calibration_points[1][0], calibration_points[2][0])
@@ -136,9 +320,8 @@ class faceAimer():
         # get width and height of pose coord space
         self.pose_width = self.x_max - self.x_min
         self.pose_height = self.y_max - self.y_min
-        # get the average point for center of screen
-        self.pose_center = (self.x_min + self.pose_width/2,
-                            self.y_min + self.pose_height/2)
+        # the pose that maps to the center of the screen
+        self.pose_center = self.screen_mapping.toPose((self.res_x/2, self.res_y/2))
 
         # get deadzone radius for controller method
         self.controller_deadzone_radius = int(
@@ -146,149 +329,306 @@ class faceAimer():
 
         return
 
+    def recalibrate(self):
+        # pick the corners again while running, the controllers stop until it's done
+        self.pose_channel.put((-1, -1), self.frame_time)
+        self.calibrate(reuse=False)
+        pose_dimensions = (self.pose_width, self.pose_height, self.pose_center)
+        self.mouse_controller.setCalibration(pose_dimensions, self.screen_mapping)
+        self.stick_controller.setCalibration(pose_dimensions, self.controller_deadzone_radius)
+
+    def calibrationSource(self):
+        # what the corners depend on: they're pose points in the camera image, solved with these settings
+        subset = face_aimer_settings['pnp_landmarks']
+        return {'frame': [self.frame_width, self.frame_height],
+                'camera_matrix': self.camera_matrix.tolist(),
+                'pnp_method': face_aimer_settings['pnp_method'],
+                'pnp_landmarks': subset if isinstance(subset, str) else list(subset)}
+
+    def saveCalibration(self, path):
+        calibration = {'corners': [[float(x), float(y)] for (x, y) in self.calibration_points],
+                       'screen': [self.res_x, self.res_y],
+                       'homography': self.screen_mapping.homography.tolist()}
+        calibration.update(self.calibrationSource())
+        with open(path, 'w') as f:
+            json.dump(calibration, f, indent=4)
+
+    def loadCalibration(self, path):
+        # returns False without loading anything if the corners were picked with a different camera or solver
+        with open(path) as f:
+            calibration = json.load(f)
+        source = self.calibrationSource()
+        for key in ('frame', 'pnp_method', 'pnp_landmarks'):
+            if calibration.get(key) != source[key]:
+                return False
+        if 'camera_matrix' not in calibration or not np.allclose(calibration['camera_matrix'], self.camera_matrix):
+            return False
+        # the saved homography only holds for the screen resolution it was made for, otherwise work it out again from the corners
+        homography = None
+        if calibration.get('screen') == [self.res_x, self.res_y]:
+            homography = calibration.get('homography')
+        self.setCalibration([tuple(point) for point in calibration['corners']], homography)
+        return True
+
+    def readFrame(self):
+        # get the newest camera frame and the time it was captured
+        if self.grabber is not None:
+            ok, frame, self.frame_time = self.grabber.read()
+        else:
+            tic = perf_counter()
+            ok, frame = self.cap.read(self.frame_buffer)
+            self.frame_time = perf.since('capture', tic)
+            if ok:
+                self.frame_buffer = frame
+
+        if not ok:
+            print("Lost camera feed! Quitting...")
+            self.shutdown()
+        return frame
+
+    def getKey(self):
+        # get the last key pressed, or -1 if none
+        if self.renderer is not None:
+            return self.renderer.getKey()
+        if self.hotkeys is not None:
+            return self.hotkeys.getKey()
+        return cv.waitKey(1)
+
     def trackFace(self, frame):
         # updates face landmarks and returns x and y values for nose tip and pose position. Not scaled or adjusted
+        # the frame is tracked as the camera sees it, only the returned points are mirrored
 
-        # convert frame to grayscale
-        gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+        # grayscale copy of the frame, BGR frames are converted
+        self.gray_index ^= 1
+        tic = perf_counter()
+        gray = lumaImage(frame, dst=self.gray_buffers[self.gray_index])
+        perf.since('grayscale', tic)
 
-        # detect a face
-        faces = self.detector(gray)
-        
-        if not len(faces):
+        # get facial landmarks
+        landmarks = self.tracker.track(gray)
+        if not self.startup_done:
+            self.finishStartup()
+
+        if landmarks is None:
             # if can't find face, just return negative
             return ((-1, -1), (-1, -1))
-
-        # get facial landmarks
-        face = faces[0]
-        self.landmarks = face_utils.shape_to_np(self.predictor(gray, face), dtype=np.float32)
+        return self.solveLandmarks(landmarks, gray)
+
+    def trackFacePooled(self, frame, block=False):
+        # hands the frame to a tracking worker, returns (nosePoint, posePoint, capture time) for the newest finished frame or None
+        # if block is set and every worker is busy, waits for one to finish instead of dropping the frame
+
+        # pick up finished frames, in order
+        tracked = None
+        for result in self.pool.results(timeout=1.0 if block and not self.pool.free_slots else 0):
+            if not self.startup_done:
+                self.finishStartup()
+            self.tracker.applyResult(result.face_box, result.landmarks, self.pool.frame_shape)
+            if result.landmarks is None:
+                tracked = ((-1, -1), (-1, -1), result.timestamp)
+            else:
+                tracked = self.solveLandmarks(result.landmarks) + (result.timestamp,)
+
+        slot = self.pool.acquireSlot()
+        if slot is not None:
+            # convert straight into shared memory
+            lumaImage(frame, dst=self.pool.slots[slot])
+            self.pool.submit(slot, self.frame_time, self.tracker.nextBox())
+
+        return tracked
+
+    def solveLandmarks(self, landmarks, gray=None):
+        # solves the head pose for the landmarks, returns x and y values for nose tip and pose position
+        self.landmarks = landmarks
 
         # solve for PnP
-        (_, rot_vect, trans_vect) = cv.solvePnP(self.model_points, self.landmarks, self.camera_matrix, self.dist_coeffs)
+        (rot_vect, trans_vect, error) = self.solver.solve(self.landmarks)
+        if gray is not None and self.tracker.propagated and error > self.tracker.flow_reproject_error:
+            # optical flow drifted off the face, refit the landmarks with the predictor and solve again
+            self.landmarks = self.tracker.refitLandmarks(gray)
+            (rot_vect, trans_vect, error) = self.solver.solve(self.landmarks)
+        if error > self.solver.reset_error:
+            # the landmarks don't fit a face, look for it again next frame. The pose is no good either, treat it like no face
+            self.tracker.resetTracking()
+            return ((-1, -1), (-1, -1))
+
+        # last head pose, for recording
+        self.rot_vect = rot_vect
+        self.trans_vect = trans_vect
 
-        # get pose point projection in terms of image
-        (pose_pt_2D, _) = cv.projectPoints(np.array([0.0, 0.0, 1000]), rot_vect, trans_vect, self.camera_matrix, self.dist_coeffs)
+        # get pose point projection in terms of image, mirrored like the preview
+        tic = perf_counter()
+        posePoint = self.mirrorPoint(self.solver.projectPose(rot_vect, trans_vect))
+        perf.since('projectPoints', tic)
+        nosePoint = self.mirrorPoint(self.landmarks[33])
 
-        nosePoint = (self.landmarks[33][0], self.landmarks[33][1])
-        posePoint = (pose_pt_2D[0][0][0], pose_pt_2D[0][0][1])
+        return (nosePoint, posePoint)
 
-        return (nosePoint, posePoint)          
+    def mirrorPoint(self, point):
+        # camera coordinates to mirrored ones, same as flipping the frame
+        return (self.frame_width - 1 - point[0], point[1])          
 
     def shutdown(self):
         print("Exiting Face Aimer Program...")
-        # stop current controller thread
-        self.stop_controller_event.set()
-        try:
-            self.controller_thread.join()
-        except AttributeError:
-            pass
+        print(self.tracker.trackingStats())
+        if self.pool is not None:
+            print(self.pool.poolStats())
+            self.pool.close()
+        print(self.solver.solverStats())
+        if self.governor is not None:
+            print(self.governor.governorStats())
+        print(perf.perfStats())
+        # stop the controller thread
+        if self.controller_thread is not None:
+            self.controller_thread.stop()
+            print(self.controller_thread.controller.scheduler.schedulerStats())
+            print(self.controller_thread.threadStats())
+            print(self.output.outputStats())
+            self.output.close()
+
+        # stop the preview
+        if self.renderer is not None:
+            self.renderer.stop()
+        if self.hotkeys is not None:
+            self.hotkeys.stop()
 
         # release resources
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.publisher is not None:
+            print(self.publisher.publisherStats())
+            self.publisher.close()
+        if self.grabber is not None:
+            self.grabber.stop()
+            print(f"Capture: {self.grabber.frame_count} frames, {self.grabber.dropped_frames} stale frames dropped")
         self.cap.release()
         cv.destroyAllWindows()
         exit(0)
 
-    def startControllerThread(self):
-        # select controller
-        if self.control_mode == 'mouse':
-            self.selected_controller = self.mouse_controller
-        elif self.control_mode == 'stick':
-            self.selected_controller = self.stick_controller
-
-        # create controller daemon thread
-        self.controller_thread = threading.Thread(target=self.selected_controller.start_controller, args=[self.stop_controller_event], daemon=True)
-        self.controller_thread.start()
-        return
-
     def run(self, debug=False):
+        if self.preview_mode == 'headless':
+            # no window to take key presses, listen for global hotkeys instead
+            self.hotkeys = hotkeyListener()
+            self.hotkeys.start()
+
         # calibrate
         self.calibrate()
 
-        # init variables
-        self.nosePoint = (0, 0)
-        self.posePoint = (0, 0)
-        self.controller_queue = queue.Queue()
+        # keeps the last few minutes of frames & moves on disk
+        if face_aimer_settings['flight_recorder_file']:
+            self.recorder = flightRecorder()
+        # shares every pose with other programs
+        if face_aimer_settings['pose_broadcast_port'] or face_aimer_settings['pose_broadcast_shm']:
+            self.publisher = posePublisher()
+
+        # init variables, no face until the first frame is tracked (with tracking workers that's a frame or two later)
+        self.nosePoint = (-1, -1)
+        self.posePoint = (-1, -1)
+        self.pose_channel = poseChannel()
         pose_dimensions = (self.pose_width, self.pose_height, self.pose_center)
 
-        # initialize the controllers
-        self.mouse_controller = mouseController(self.controller_queue, pose_dimensions, (self.x_min, self.y_min))
-        self.stick_controller = stickController(self.controller_queue, pose_dimensions, self.controller_deadzone_radius)
+        # initialize the controllers, sharing one mouse output
+        self.output = makeOutputBackend()
+        self.output.recorder = self.recorder
+        self.mouse_controller = mouseController(self.pose_channel, pose_dimensions, self.screen_mapping, self.output)
+        self.stick_controller = stickController(self.pose_channel, pose_dimensions, self.controller_deadzone_radius, self.output)
 
-        # start controller thread
-        self.startControllerThread()
+        # start the controller thread, it runs whichever controller is selected
+        self.controller_thread = controllerThread(self.pose_channel, {'mouse': self.mouse_controller, 'stick': self.stick_controller},
+                                                  self.control_mode)
+        self.controller_thread.start()
+
+        if self.preview_mode == 'threaded':
+            # hand the window over to the preview thread
+            cv.destroyWindow('Face Aimer')
+            # with its own painter, every painter draws into its own buffer
+            self.renderer = previewRenderer(previewPainter(), 'Face Aimer')
+            self.renderer.start()
 
         # start main loop
         while True:
-            # read a frame, mirror it
-            _, frame = self.cap.read()
-            frame = cv.flip(frame, 1)
+            # read a frame, it's only mirrored & converted to color if the preview shows it
+            frame = self.readFrame()
+            frame_start = perf_counter()
 
             # get current nose & pose position
-            (self.nosePoint, self.posePoint) = self.trackFace(frame)
-
-            # add targets to controller queue
+            pose_time = self.frame_time
+            new_pose = True
+            if self.pool is None:
+                (self.nosePoint, self.posePoint) = self.trackFace(frame)
+            else:
+                tracked = self.trackFacePooled(frame)
+                new_pose = tracked is not None
+                if new_pose:
+                    (self.nosePoint, self.posePoint, pose_time) = tracked
+
+            if new_pose:
+                found = self.posePoint[0] != -1
+                (rot_vect, trans_vect) = (self.rot_vect, self.trans_vect) if found else (None, None)
+                if self.recorder is not None:
+                    self.recorder.recordFrame(pose_time, self.posePoint, self.nosePoint, rot_vect, trans_vect, found)
+                if self.publisher is not None:
+                    self.publisher.publish(pose_time, self.posePoint, rot_vect, trans_vect, found)
+
+            # hand the new target to the controller, nothing goes to it while paused
             if self.paused:
-                self.controller_queue.put((-1, -1), block=False)
                 pause_status_text = self.unpause_text
-            if not self.paused:
-                self.controller_queue.put(self.posePoint, block=False)
+            else:
+                if new_pose:
+                    self.pose_channel.put(self.posePoint, pose_time)
                 pause_status_text = self.pause_text
-
-            # draw controls & status text
-            if self.show_text:
-                # write quit text
-                cv.putText(frame, self.quit_text, self.primary_text_position, self.font_face,
-                        self.font_scale, self.font_color, self.font_thickness, self.font_linetype)
-                # write switch control text
-                cv.putText(frame, self.switch_mode_text, self.secondary_text_position, self.font_face,
-                            self.font_scale, self.font_color, self.font_thickness, self.font_linetype)
-                # write paused status text
-                cv.putText(frame, pause_status_text, self.tertiary_text_position, self.font_face,
-                        self.font_scale, self.font_color, self.font_thickness, self.font_linetype)
-                # write hide controls text
-                cv.putText(frame, self.hide_controls_text, self.fourth_text_position, self.font_face,
-                        self.font_scale, self.font_color, self.font_thickness, self.font_linetype)
-
-            # if couldn't find a face, skip all this
-            if not (self.posePoint[0] == -1):
-
-                # get points as ints
-                nosePointInt = (int(self.nosePoint[0]), int(self.nosePoint[1]))
-                posePointInt = (int(self.posePoint[0]), int(self.posePoint[1]))
-                poseCenterInt = (int(self.pose_center[0]), int(self.pose_center[1]))
-
-                # draw facial landmarks on frame
-                for tracked_pts in self.landmarks:
-                    cv.circle(frame, (int(tracked_pts[0]), int(tracked_pts[1])), 1, self.landmarks_color, -1)
-
-                # draw mode-specific overlays
-                if self.control_mode == 'stick':
-                    # draw gaze line from nose to pose point
-                    cv.line(frame, nosePointInt, posePointInt, self.gaze_line_color, 2)
-                    # draw deadzone
-                    cv.circle(frame, poseCenterInt, self.controller_deadzone_radius, self.deadzone_color, thickness=2)
-                elif self.control_mode == 'mouse':
-                    # draw target position
-                    cv.drawMarker(frame, posePointInt, self.marker_color, cv.MARKER_CROSS, 20, 2, cv.LINE_8)
-
+            tic = perf.since('tracking', frame_start)
+
+            # draw the preview, less often if the governor is short on time
+            if self.preview_mode != 'headless' and (self.governor is None or self.governor.previewDue()):
+                # controls & status text
+                text_lines = ()
+                if self.show_text:
+                    text_lines = ((self.quit_text, self.font_scale), (self.switch_mode_text, self.font_scale),
+                                  (pause_status_text, self.font_scale), (self.recalibrate_text, self.font_scale),
+                                  (self.hide_controls_text, self.font_scale), (self.perf_text, self.font_scale))
+                # target coords & detection count
+                debug_lines = ()
                 if debug:
-                    # draw target coords
-                    cv.putText(frame, f"X: {self.posePoint[0]}", (20, 100), cv.FONT_HERSHEY_SIMPLEX, 0.75, (0, 0, 255), thickness=2)
-                    cv.putText(frame, f"Y: {self.posePoint[1]}", (20, 130), cv.FONT_HERSHEY_SIMPLEX, 0.75, (0, 0, 255), thickness=2)
+                    debug_lines = (f"X: {self.posePoint[0]}", f"Y: {self.posePoint[1]}",
+                                   f"Detections: {self.tracker.full_detections}/{self.tracker.tracked_frames}",
+                                   f"PnP error: {self.solver.error:.2f} px",
+                                   f"Pose age: {self.controller_thread.controller.pose_age*1000:.1f} ms",
+                                   f"Tick rate: {self.controller_thread.controller.scheduler.achievedRate():.0f} Hz")
+                    if self.governor is not None:
+                        debug_lines += (f"Quality: {self.governor.levelName()}",)
+                # per-stage timings
+                perf_lines = ()
+                if self.show_perf:
+                    perf_lines = perf.hudLines()
+                    if self.governor is not None:
+                        perf_lines += (f"quality level {self.governor.level}: {self.governor.levelName()}",)
+                # if couldn't find a face, only the text is drawn
+                landmarks = None if self.posePoint[0] == -1 else self.landmarks
+                state = previewState(frame, landmarks, self.nosePoint, self.posePoint, self.pose_center,
+                                     self.control_mode, self.controller_deadzone_radius, text_lines, debug_lines, perf_lines)
+
+                if self.renderer is not None:
+                    # the preview thread draws it when it gets to it
+                    self.renderer.update(state)
+                else:
+                    # show the frame
+                    cv.imshow('Face Aimer', self.painter.draw(state))
+                    perf.since('render', tic)
 
-            # show the frame
-            cv.imshow('Face Aimer', frame)
+            # write out the stats every perf_export_interval
+            perf.exportIfDue()
+
+            if self.governor is not None:
+                self.governor.record(perf_counter() - frame_start)
 
             # get user input
-            key = cv.waitKey(1)
+            key = self.getKey()
             if key == 27: # 'ESC' key
                 #break out of loop
                 break
             elif key == 9: # 'TAB' key
                 # switch control modes
-                # stop current controller thread
-                self.stop_controller_event.set()
-                self.controller_thread.join()
                 # toggle selected control mode
                 if self.control_mode == 'mouse':
                     self.control_mode = 'stick'
@@ -296,15 +636,21 @@ class faceAimer():
                     self.control_mode = 'mouse'
                 # set new control text
                 self.switch_mode_text = f"'TAB' to switch control modes | {self.control_mode}"
-                # initialize new controller thread
-                self.stop_controller_event.clear()
-                self.startControllerThread()
+                # the controller thread picks up the new controller
+                self.controller_thread.setMode(self.control_mode)
             elif key == 32: # 'SPACEBAR'
-                # toggle pause
+                # toggle pause, the controller stops moving & idles until it's unpaused
                 self.paused = not self.paused
+                if self.paused:
+                    self.pose_channel.put((-1, -1), self.frame_time)
+            elif (key == 67) or (key == 99): # 'C' or 'c' key
+                self.recalibrate()
             elif (key == 72) or (key == 104): # 'H' or 'h' key
                 # toggle hiding controls text
                 self.show_text = not self.show_text
+            elif (key == 80) or (key == 112): # 'P' or 'p' key
+                # toggle the performance overlay
+                self.show_perf = not self.show_perf
 
         # shutdown
         self.shutdown()
@@ -312,5 +658,9 @@ class faceAimer():
 
 # run the program
 if __name__ == '__main__':
-    face_aimer = faceAimer()
+    parser = argparse.ArgumentParser(description="Control your mouse or aim with your head.")
+    parser.add_argument('--startup-profile', action='store_true', help="print how long each startup stage took once the first frame is tracked")
+    args = parser.parse_args()
+
+    face_aimer = faceAimer(startup_profile=args.startup_profile)
     face_aimer.run()
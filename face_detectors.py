@@ -0,0 +1,93 @@
+import os
+
+import cv2 as cv
+import dlib
+
+from settings import face_aimer_settings
+
+
+class faceDetector():
+    # full-frame face detection on a grayscale frame. Subclasses define detect(gray), returning dlib rectangles for the
+    # landmark predictor, best face first
+    min_face_size = 0 # smallest face (px) the detector can find
+
+
+class hogDetector(faceDetector):
+    # dlib's HOG detector, what the landmark predictor was trained on
+    min_face_size = 80 # its detection window
+
+    def __init__(self, upsample=None):
+        self.upsample = face_aimer_settings['hog_upsample'] if upsample is None else upsample
+        self.detector = dlib.get_frontal_face_detector()
+
+    def detect(self, gray):
+        return self.detector(gray, self.upsample)
+
+
+class cascadeDetector(faceDetector):
+    # OpenCV Haar or LBP cascade, much cheaper than HOG but with more misses & false positives
+    min_face_size = 24 # the bundled cascades' window
+
+    def __init__(self, cascade_file=None):
+        if cascade_file is None:
+            cascade_file = face_aimer_settings['cascade_file']
+        if not os.path.exists(cascade_file):
+            # a name from the cascades bundled with opencv-python
+            cascade_file = os.path.join(cv.data.haarcascades, cascade_file)
+        self.classifier = cv.CascadeClassifier(cascade_file)
+        if self.classifier.empty():
+            raise IOError(f"Can't load face cascade {cascade_file}")
+        self.min_face = face_aimer_settings['cascade_min_face']
+        self.scale_factor = 1.2 # image pyramid step, smaller steps find more faces but take a lot longer
+        self.min_neighbors = 5 # overlapping hits needed to count as a face, higher means fewer false positives
+
+    def detect(self, gray):
+        # most of the time goes on the small scales, skip the ones too small to be someone sitting at the camera
+        min_size = int(gray.shape[0]*self.min_face)
+        faces = self.classifier.detectMultiScale(gray, scaleFactor=self.scale_factor, minNeighbors=self.min_neighbors,
+                                                 minSize=(min_size, min_size))
+        # biggest face first, it's most likely the user's
+        faces = sorted(faces, key=lambda face: face[2]*face[3], reverse=True)
+        return [dlib.rectangle(int(x), int(y), int(x + w), int(y + h)) for (x, y, w, h) in faces]
+
+
+class yunetDetector(faceDetector):
+    # OpenCV's YuNet CNN detector, from a local .onnx model file
+    min_face_size = 10
+
+    def __init__(self, model_file=None):
+        if model_file is None:
+            model_file = face_aimer_settings['yunet_model']
+        if not os.path.exists(model_file):
+            raise IOError(f"YuNet model {model_file} not found, download it from the OpenCV model zoo")
+        self.score_threshold = face_aimer_settings['yunet_score_threshold']
+        self.detector = cv.FaceDetectorYN.create(model_file, "", (320, 320), self.score_threshold)
+        self.input_shape = None
+        self.bgr = None # the network takes 3 channels, the grayscale frame is expanded into this
+
+    def detect(self, gray):
+        if gray.shape != self.input_shape:
+            self.input_shape = gray.shape
+            self.detector.setInputSize((gray.shape[1], gray.shape[0]))
+            self.bgr = None
+        self.bgr = cv.cvtColor(gray, cv.COLOR_GRAY2BGR, dst=self.bgr)
+
+        (_, faces) = self.detector.detect(self.bgr)
+        if faces is None:
+            return []
+        # rows are x, y, w, h, 5 facial points and the score, already sorted by score
+        return [dlib.rectangle(int(x), int(y), int(x + w), int(y + h)) for (x, y, w, h) in faces[:, :4]]
+
+
+def makeFaceDetector(detector_name=None):
+    # build the face detector selected in settings
+    if detector_name is None:
+        detector_name = face_aimer_settings['face_detector']
+
+    if detector_name == 'hog':
+        return hogDetector()
+    elif detector_name == 'cascade':
+        return cascadeDetector()
+    elif detector_name == 'yunet':
+        return yunetDetector()
+    raise ValueError(f"Unknown face detector '{detector_name}'")
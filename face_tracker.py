@@ -0,0 +1,305 @@
+import os
+import threading
+from time import perf_counter
+
+import cv2 as cv
+import dlib
+import numpy as np
+
+from face_detectors import makeFaceDetector
+from perf_stats import perf
+from settings import face_aimer_settings
+
+
+class faceTracker():
+
+    def __init__(self, load_models=True):
+        # import settings
+        self.tracking_strategy = face_aimer_settings['tracking_strategy']
+        self.redetect_interval = face_aimer_settings['redetect_interval']
+        self.detection_scale = face_aimer_settings['detection_scale']
+
+        # facial recognition models, not needed when tracking workers run them
+        self.models_loaded = threading.Event()
+        self.model_error = None
+        self.model_load_time = 0
+        self.model_wait_time = 0 # time track() spent waiting on background loading
+        if load_models:
+            self.loadModels()
+
+        # roi tracking state
+        self.face_box = None
+        self.face_size = 0
+        self.box_offset = (0, 0)
+        self.box_scale = 1
+        self.frames_since_detect = 0
+        self.min_face_size = 20 # smallest landmark span (px) still considered a face
+        self.max_size_change = 1.5 # largest frame-to-frame change in face size before tracking counts as lost
+
+        # optical flow landmark propagation, roi tracking only
+        self.landmark_flow = face_aimer_settings['landmark_flow'] and self.tracking_strategy == 'roi'
+        self.flow_max_frames = face_aimer_settings['flow_max_frames']
+        self.flow_fb_error = face_aimer_settings['flow_fb_error']
+        self.flow_reproject_error = face_aimer_settings['flow_reproject_error']
+        self.flow_params = dict(winSize=(15, 15), maxLevel=2, criteria=(cv.TERM_CRITERIA_EPS | cv.TERM_CRITERIA_COUNT, 20, 0.03))
+        self.flow_start = np.zeros((68, 1, 2), dtype=np.float32)
+        self.flow_next = np.zeros((68, 1, 2), dtype=np.float32)
+        self.flow_back = np.zeros((68, 1, 2), dtype=np.float32)
+        self.prev_gray = None
+        self.prev_landmarks = None
+        self.last_box = None
+        self.flow_frames = 0
+        self.propagated = False # the last landmarks came from optical flow rather than the predictor
+
+        # landmarks are written into the same array every frame, copy them to keep them past the next frame
+        self.landmarks = np.zeros((68, 2), dtype=np.float32)
+
+        # tracking statistics
+        self.tracked_frames = 0
+        self.full_detections = 0
+        self.lost_count = 0
+        self.predictor_runs = 0
+        self.propagated_frames = 0
+        self.flow_rejects = 0
+        self.refits = 0
+
+    def loadModels(self):
+        tic = perf_counter()
+        self.detector = makeFaceDetector()
+        self.predictor = dlib.shape_predictor(os.path.join('resources', 'shape_predictor_68_face_landmarks.dat'))
+        self.model_load_time = perf_counter() - tic
+        self.models_loaded.set()
+
+    def loadModelsInBackground(self):
+        # load the models on their own thread, the first track() waits for them
+        threading.Thread(target=self.backgroundLoad, daemon=True).start()
+
+    def backgroundLoad(self):
+        try:
+            self.loadModels()
+        except Exception as error:
+            # raised from track() instead, on the main thread
+            self.model_error = error
+            self.models_loaded.set()
+
+    def waitModels(self):
+        if not self.models_loaded.is_set():
+            tic = perf_counter()
+            self.models_loaded.wait()
+            self.model_wait_time += perf_counter() - tic
+        if self.model_error is not None:
+            raise self.model_error
+
+    def detectFace(self, gray):
+        # run the full-frame face detector, returns the first face box or None
+        self.full_detections += 1
+        tic = perf_counter()
+
+        if self.detection_scale == 1:
+            faces = self.detector.detect(gray)
+        else:
+            # detect on a downscaled frame, landmarks are still fit at full resolution
+            small = cv.resize(gray, None, fx=self.detection_scale, fy=self.detection_scale, interpolation=cv.INTER_AREA)
+            faces = self.detector.detect(small)
+        perf.since('detect', tic)
+
+        if not len(faces):
+            return None
+        return self.scaleBox(faces[0], 1/self.detection_scale)
+
+    def scaleBox(self, face_box, scale):
+        if scale == 1:
+            return face_box
+        return dlib.rectangle(int(face_box.left()*scale), int(face_box.top()*scale),
+                              int(face_box.right()*scale), int(face_box.bottom()*scale))
+
+    def predictLandmarks(self, gray, face_box):
+        self.predictor_runs += 1
+        tic = perf_counter()
+        shape = self.predictor(gray, face_box)
+        for i in range(68):
+            point = shape.part(i)
+            self.landmarks[i] = (point.x, point.y)
+        perf.since('landmarks', tic)
+        return self.landmarks
+
+    def propagateLandmarks(self, gray):
+        # carry the previous landmarks into this frame with optical flow, None if the predictor has to run instead
+        self.propagated = False
+        if not self.landmark_flow or self.prev_landmarks is None or self.flow_frames >= self.flow_max_frames:
+            return None
+
+        tic = perf_counter()
+
+        # only flow the area around the face, image pyramids of the whole frame cost more than the predictor
+        pad = self.last_box.width()//2
+        left = max(0, self.last_box.left() - pad)
+        top = max(0, self.last_box.top() - pad)
+        right = min(gray.shape[1], self.last_box.right() + pad)
+        bottom = min(gray.shape[0], self.last_box.bottom() + pad)
+        prev_crop = self.prev_gray[top:bottom, left:right]
+        crop = gray[top:bottom, left:right]
+
+        offset = np.float32((left, top))
+        np.subtract(self.prev_landmarks, offset, out=self.flow_start[:, 0])
+        (self.flow_next, status, _) = cv.calcOpticalFlowPyrLK(prev_crop, crop, self.flow_start, self.flow_next, **self.flow_params)
+        (self.flow_back, back_status, _) = cv.calcOpticalFlowPyrLK(crop, prev_crop, self.flow_next, self.flow_back, **self.flow_params)
+
+        # tracking each point back should land it where it started, otherwise the flow can't be trusted
+        fb_error = np.linalg.norm(self.flow_back - self.flow_start, axis=2)
+        perf.since('optical flow', tic)
+        if not (status.all() and back_status.all()) or fb_error.max() > self.flow_fb_error:
+            self.flow_rejects += 1
+            return None
+
+        self.propagated = True
+        self.propagated_frames += 1
+        # the previous landmarks aren't needed anymore, overwrite them
+        np.add(self.flow_next[:, 0], offset, out=self.landmarks)
+        return self.landmarks
+
+    def setLandmarkFlow(self, enabled, max_frames):
+        # turn optical flow propagation on or off mid-session, roi tracking only
+        enabled = enabled and self.tracking_strategy == 'roi'
+        if enabled != self.landmark_flow:
+            # the remembered frame is stale if flow was off, start over from the next predictor run
+            self.prev_landmarks = None
+            self.flow_frames = 0
+        self.landmark_flow = enabled
+        self.flow_max_frames = max_frames
+
+    def rememberLandmarks(self, gray, landmarks, face_box):
+        # keep this frame for the next frame's optical flow
+        if not self.landmark_flow:
+            return
+        self.flow_frames = self.flow_frames + 1 if self.propagated else 0
+        self.prev_gray = gray
+        self.prev_landmarks = landmarks
+        self.last_box = face_box
+
+    def refitLandmarks(self, gray):
+        # rerun the predictor on this frame when the propagated landmarks turn out not to fit a face
+        self.refits += 1
+        self.propagated = False
+        landmarks = self.predictLandmarks(gray, self.last_box)
+        if self.updateFaceBox(landmarks, gray.shape):
+            self.rememberLandmarks(gray, landmarks, self.last_box)
+        else:
+            self.resetTracking()
+        return landmarks
+
+    def roiBox(self):
+        # face box from the previous frame's landmarks, or None if a full detection is due
+        if self.tracking_strategy != 'roi' or self.face_box is None:
+            return None
+        if self.frames_since_detect >= self.redetect_interval:
+            return None
+        return self.face_box
+
+    def landmarkExtent(self, landmarks):
+        # center and size of the square around the landmarks
+        (left, top) = landmarks.min(axis=0)
+        (right, bottom) = landmarks.max(axis=0)
+        return ((left + right)/2, (top + bottom)/2), max(right - left, bottom - top)
+
+    def learnBoxGeometry(self, face_box, landmarks):
+        # remember how the detector frames a face relative to its landmarks, so roi boxes match it
+        (center, size) = self.landmarkExtent(landmarks)
+        self.box_offset = ((face_box.left() + face_box.right())/2 - center[0])/size, ((face_box.top() + face_box.bottom())/2 - center[1])/size
+        self.box_scale = face_box.width()/size
+
+    def updateFaceBox(self, landmarks, frame_shape):
+        # build the next frame's face box from the landmarks, returns False if tracking was lost
+        (center, size) = self.landmarkExtent(landmarks)
+
+        # the landmarks collapsed, left the frame or jumped in size, so the face is gone
+        lost = (size < self.min_face_size
+                or not (0 <= center[0] < frame_shape[1] and 0 <= center[1] < frame_shape[0])
+                or (self.face_box is not None
+                    and not (1/self.max_size_change < size/self.face_size < self.max_size_change)))
+        if lost:
+            self.face_box = None
+            return False
+
+        # frame the box the same way the detector did
+        box_x = center[0] + self.box_offset[0]*size
+        box_y = center[1] + self.box_offset[1]*size
+        half_size = self.box_scale*size/2
+        self.face_box = dlib.rectangle(int(round(box_x - half_size)), int(round(box_y - half_size)),
+                                       int(round(box_x + half_size)), int(round(box_y + half_size)))
+        self.face_size = size
+        return True
+
+    def resetTracking(self):
+        # drop the roi, the next frame runs a full detection
+        self.face_box = None
+        self.prev_landmarks = None
+
+    def track(self, gray):
+        # returns the 68 facial landmarks for the frame, or None if no face is found
+        self.waitModels()
+        self.tracked_frames += 1
+
+        # reuse the face box from the previous frame if we have one
+        face_box = self.roiBox()
+        if face_box is not None:
+            self.frames_since_detect += 1
+            # optical flow if it holds up, otherwise fit the landmarks in the box
+            landmarks = self.propagateLandmarks(gray)
+            if landmarks is None:
+                landmarks = self.predictLandmarks(gray, face_box)
+            if self.updateFaceBox(landmarks, gray.shape):
+                self.rememberLandmarks(gray, landmarks, face_box)
+                return landmarks
+            # lost the face, fall back to full detection on this frame
+            self.lost_count += 1
+
+        # full-frame detection
+        self.frames_since_detect = 0
+        self.face_box = None
+        self.propagated = False
+        face_box = self.detectFace(gray)
+        if face_box is None:
+            self.prev_landmarks = None
+            return None
+
+        landmarks = self.predictLandmarks(gray, face_box)
+        if self.tracking_strategy == 'roi':
+            self.learnBoxGeometry(face_box, landmarks)
+            self.updateFaceBox(landmarks, gray.shape)
+            self.rememberLandmarks(gray, landmarks, face_box)
+        return landmarks
+
+    def nextBox(self):
+        # box for a tracking worker to fit landmarks in, None asks it for a full detection
+        self.tracked_frames += 1
+        face_box = self.roiBox()
+        if face_box is None:
+            self.frames_since_detect = 0
+            self.full_detections += 1
+            return None
+        self.frames_since_detect += 1
+        return (face_box.left(), face_box.top(), face_box.right(), face_box.bottom())
+
+    def applyResult(self, face_box, landmarks, frame_shape):
+        # update the roi from a tracking worker's result, face_box is set if the worker ran a full detection
+        if landmarks is None:
+            self.face_box = None
+        elif face_box is not None:
+            self.face_box = None
+            if self.tracking_strategy == 'roi':
+                self.learnBoxGeometry(dlib.rectangle(*face_box), landmarks)
+                self.updateFaceBox(landmarks, frame_shape)
+        elif not self.updateFaceBox(landmarks, frame_shape):
+            self.lost_count += 1
+
+    def trackingStats(self):
+        if not self.tracked_frames:
+            return "Tracking: no frames tracked"
+        detect_rate = self.full_detections/self.tracked_frames
+        stats = (f"Tracking ({self.tracking_strategy}): {self.tracked_frames} frames, "
+                 f"{self.full_detections} full detections ({detect_rate:.1%}), {self.lost_count} roi losses")
+        if self.landmark_flow:
+            stats += (f", {self.predictor_runs} predictor runs, {self.propagated_frames} frames propagated by optical flow "
+                      f"({self.flow_rejects} flow rejects, {self.refits} refits)")
+        return stats
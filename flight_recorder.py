@@ -0,0 +1,104 @@
+import mmap
+import os
+import struct
+from time import perf_counter, time
+
+import numpy as np
+
+from settings import face_aimer_settings
+
+# file layout: header, then a ring of frame records, then a ring of move records. Every record starts with its sequence number
+# (0 = never written), so a write is one pack_into and the newest records are found by their sequence numbers
+header_struct = struct.Struct('<4sIQQ')
+header_size = 64
+magic = b'FAFR'
+version = 1
+# seq, time, pose point (x, y), nose point (x, y), rvec, tvec, face found. The vectors are solvePnP's float64 arrays,
+# packed as their raw bytes, unpacking them into floats would cost more than the rest of the write
+frame_struct = struct.Struct('<Qd4f24s24s?7x')
+# seq, time, requested dx & dy, pixels sent (x, y)
+move_struct = struct.Struct('<Qdffii')
+
+# the same layouts for reading the file back with numpy
+frame_dtype = np.dtype([('seq', '<u8'), ('time', '<f8'), ('pose_point', '<f4', (2,)), ('nose_point', '<f4', (2,)),
+                        ('rvec', '<f8', (3,)), ('tvec', '<f8', (3,)), ('found', '?'), ('pad', 'V7')])
+move_dtype = np.dtype([('seq', '<u8'), ('time', '<f8'), ('dx', '<f4'), ('dy', '<f4'), ('sent_x', '<i4'), ('sent_y', '<i4')])
+
+no_vector = np.full(3, np.nan).tobytes()
+
+
+class flightRecorder():
+    # always-on record of the last few minutes of tracked frames and mouse moves, in a fixed-size memory-mapped file.
+    # Frames are only written from the tracking loop and moves from the controller thread, so neither ring needs a lock
+
+    def __init__(self, path=None, frame_capacity=None, move_capacity=None):
+        self.path = path if path is not None else face_aimer_settings['flight_recorder_file']
+        self.frame_capacity = frame_capacity if frame_capacity is not None else face_aimer_settings['flight_recorder_frames']
+        self.move_capacity = move_capacity if move_capacity is not None else face_aimer_settings['flight_recorder_moves']
+        self.frames_offset = header_size
+        self.moves_offset = self.frames_offset + self.frame_capacity*frame_struct.size
+        file_size = self.moves_offset + self.move_capacity*move_struct.size
+
+        # records are stamped with wall clock time so they still line up after a restart
+        self.clock_offset = time() - perf_counter()
+
+        # carry on after the last session's records if the file has the same layout, otherwise start a new one
+        header = header_struct.pack(magic, version, self.frame_capacity, self.move_capacity)
+        reuse = os.path.exists(self.path) and os.path.getsize(self.path) == file_size
+        if reuse:
+            with open(self.path, 'rb') as f:
+                reuse = f.read(header_struct.size) == header
+        if not reuse:
+            with open(self.path, 'wb') as f:
+                f.truncate(file_size)
+        self.file = open(self.path, 'r+b')
+        self.map = mmap.mmap(self.file.fileno(), file_size)
+        self.map[:header_struct.size] = header
+
+        (frames, moves) = readRings(self.map, self.frame_capacity, self.move_capacity)
+        self.frame_seq = int(frames['seq'].max(initial=0))
+        self.move_seq = int(moves['seq'].max(initial=0))
+        del frames, moves # the mmap can't be closed while numpy still has views of it
+
+        # looked up once, the writes are on the hot path
+        self.packFrame = frame_struct.pack_into
+        self.packMove = move_struct.pack_into
+
+    def recordFrame(self, frame_time, pose_point, nose_point, rot_vect, trans_vect, found):
+        # frame_time is the perf_counter time of the frame, the vectors can be None if no pose was solved
+        self.frame_seq += 1
+        self.packFrame(self.map, self.frames_offset + (self.frame_seq % self.frame_capacity)*frame_struct.size,
+                       self.frame_seq, frame_time + self.clock_offset, pose_point[0], pose_point[1], nose_point[0], nose_point[1],
+                       no_vector if rot_vect is None else rot_vect.tobytes(), no_vector if trans_vect is None else trans_vect.tobytes(),
+                       found)
+
+    def recordMove(self, dx, dy, sent_x, sent_y):
+        # every move asked of the output, sent is what actually went to the cursor (0, 0 if it was held back)
+        self.move_seq += 1
+        self.packMove(self.map, self.moves_offset + (self.move_seq % self.move_capacity)*move_struct.size,
+                      self.move_seq, perf_counter() + self.clock_offset, dx, dy, sent_x, sent_y)
+
+    def close(self):
+        self.map.flush()
+        self.map.close()
+        self.file.close()
+
+
+def readRings(buffer, frame_capacity, move_capacity):
+    # both rings as numpy record arrays, in file order
+    frames = np.frombuffer(buffer, dtype=frame_dtype, count=frame_capacity, offset=header_size)
+    moves = np.frombuffer(buffer, dtype=move_dtype, count=move_capacity, offset=header_size + frame_capacity*frame_struct.size)
+    return (frames, moves)
+
+
+def readFlightRecord(path):
+    # snapshot of a recorder file as (frames, moves) record arrays, oldest first. Safe to read while it's being written
+    with open(path, 'rb') as f:
+        data = f.read()
+    (file_magic, file_version, frame_capacity, move_capacity) = header_struct.unpack_from(data)
+    if file_magic != magic or file_version != version:
+        raise ValueError(f"{path} isn't a flight recorder file")
+    (frames, moves) = readRings(data, frame_capacity, move_capacity)
+    frames = frames[frames['seq'] > 0]
+    moves = moves[moves['seq'] > 0]
+    return (frames[np.argsort(frames['seq'])], moves[np.argsort(moves['seq'])])
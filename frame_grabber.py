@@ -0,0 +1,72 @@
+import threading
+from time import perf_counter
+
+from perf_stats import perf
+
+
+class frameGrabber():
+
+    def __init__(self, cap):
+        # video capture to read from
+        self.cap = cap
+
+        # triple buffered frames, reused so capturing doesn't allocate:
+        # the capture thread reads into the write buffer, then swaps it with latest. read() swaps latest with the reader's buffer
+        self.condition = threading.Condition()
+        self.buffers = [None, None, None]
+        self.write_index = 0
+        self.latest_index = 1
+        self.read_index = 2
+        self.frame_time = 0
+        self.frame_count = 0 # number of frames captured
+        self.read_count = 0 # frame_count at the last read
+
+        # frames that were replaced before anyone read them
+        self.dropped_frames = 0
+
+        self.running = False
+        self.capture_thread = None
+
+    def start(self):
+        self.running = True
+        self.capture_thread = threading.Thread(target=self.captureLoop, daemon=True)
+        self.capture_thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.capture_thread is not None:
+            self.capture_thread.join()
+
+    def captureLoop(self):
+        while self.running:
+            tic = perf_counter()
+            ok, frame = self.cap.read(self.buffers[self.write_index])
+            # stamp the frame as soon as the driver hands it over
+            frame_time = perf.since('capture', tic)
+
+            with self.condition:
+                if not ok:
+                    # camera failed, wake up the reader so it can bail out
+                    self.running = False
+                    self.condition.notify_all()
+                    return
+
+                # only keep the newest frame
+                if self.frame_count > self.read_count:
+                    self.dropped_frames += 1
+                self.buffers[self.write_index] = frame
+                (self.write_index, self.latest_index) = (self.latest_index, self.write_index)
+                self.frame_time = frame_time
+                self.frame_count += 1
+                self.condition.notify_all()
+
+    def read(self, timeout=1.0):
+        # wait for a frame newer than the last one read, returns (ok, frame, frame_time)
+        # the frame stays valid until the next read
+        with self.condition:
+            self.condition.wait_for(lambda: self.frame_count > self.read_count or not self.running, timeout)
+            if self.frame_count == self.read_count:
+                return (False, None, 0)
+            self.read_count = self.frame_count
+            (self.read_index, self.latest_index) = (self.latest_index, self.read_index)
+            return (True, self.buffers[self.read_index], self.frame_time)
@@ -0,0 +1,184 @@
+import os
+from time import perf_counter, sleep
+
+import cv2 as cv
+import numpy as np
+
+from settings import face_aimer_settings
+
+image_extensions = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+class replaySource():
+    # plays back recorded frames through the same read()/get()/release() calls as cv.VideoCapture
+
+    def __init__(self, fps, realtime, loop):
+        self.fps = fps
+        self.realtime = realtime # pace reads to the recorded frame rate instead of going as fast as possible
+        self.loop = loop
+        self.next_frame_time = None
+
+    def read(self, image=None):
+        # like cv.VideoCapture.read, the frame is read into image if it's given and the right size
+        ok, frame = self.readFrame(image)
+        if not ok and self.loop:
+            self.rewind()
+            ok, frame = self.readFrame(image)
+
+        if ok and self.realtime:
+            # wait until the frame is due
+            now = perf_counter()
+            if self.next_frame_time is None or now - self.next_frame_time > 1:
+                self.next_frame_time = now
+            elif self.next_frame_time > now:
+                sleep(self.next_frame_time - now)
+            self.next_frame_time += 1/self.fps
+
+        return ok, frame
+
+    def isOpened(self):
+        return True
+
+
+class videoFileSource(replaySource):
+
+    def __init__(self, path, realtime=False, loop=False):
+        self.cap = cv.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise IOError(f"Can't open video file {path}")
+        super().__init__(self.cap.get(cv.CAP_PROP_FPS) or 30, realtime, loop)
+
+    def readFrame(self, image=None):
+        return self.cap.read(image)
+
+    def rewind(self):
+        self.seek(0)
+
+    def seek(self, frame_index):
+        # next read returns this frame
+        self.cap.set(cv.CAP_PROP_POS_FRAMES, frame_index)
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def release(self):
+        self.cap.release()
+
+
+class frameDumpSource(replaySource):
+    # frames from a folder of images / .npy files, or one .npy array of frames
+
+    def __init__(self, path, fps=30, realtime=False, loop=False):
+        if os.path.isdir(path):
+            names = sorted(name for name in os.listdir(path) if name.lower().endswith(image_extensions + ('.npy',)))
+            self.frames = [os.path.join(path, name) for name in names]
+        else:
+            # stacked (frames, height, width[, channels]) array, mapped rather than loaded
+            self.frames = np.load(path, mmap_mode='r')
+        if not len(self.frames):
+            raise IOError(f"No frames found in {path}")
+        super().__init__(fps, realtime, loop)
+
+        self.index = 0
+        self.shape = self.loadFrame(0).shape
+
+    def loadFrame(self, index, image=None):
+        frame = self.frames[index]
+        if isinstance(frame, str):
+            frame = np.load(frame) if frame.endswith('.npy') else cv.imread(frame)
+        if image is not None and image.shape == frame.shape and image.dtype == frame.dtype:
+            np.copyto(image, frame)
+            return image
+        return np.array(frame)
+
+    def readFrame(self, image=None):
+        if self.index >= len(self.frames):
+            return False, None
+        frame = self.loadFrame(self.index, image)
+        self.index += 1
+        return True, frame
+
+    def rewind(self):
+        self.seek(0)
+
+    def seek(self, frame_index):
+        self.index = frame_index
+
+    def get(self, prop):
+        if prop == cv.CAP_PROP_FRAME_WIDTH:
+            return self.shape[1]
+        elif prop == cv.CAP_PROP_FRAME_HEIGHT:
+            return self.shape[0]
+        elif prop == cv.CAP_PROP_FPS:
+            return self.fps
+        elif prop == cv.CAP_PROP_FRAME_COUNT:
+            return len(self.frames)
+        elif prop == cv.CAP_PROP_POS_FRAMES:
+            return self.index
+        return 0
+
+    def release(self):
+        self.frames = []
+
+
+def openCamera(index):
+    # open a camera with the capture format from settings, anything left as None keeps the driver default
+    cap = cv.VideoCapture(index)
+    if not cap.isOpened():
+        raise IOError(f"Can't open camera {index}")
+
+    # the pixel format has to be set before the size for some drivers to accept it
+    fourcc = face_aimer_settings['camera_fourcc']
+    if fourcc is not None:
+        cap.set(cv.CAP_PROP_FOURCC, cv.VideoWriter_fourcc(*fourcc))
+    if face_aimer_settings['camera_width'] is not None:
+        cap.set(cv.CAP_PROP_FRAME_WIDTH, face_aimer_settings['camera_width'])
+    if face_aimer_settings['camera_height'] is not None:
+        cap.set(cv.CAP_PROP_FRAME_HEIGHT, face_aimer_settings['camera_height'])
+    if face_aimer_settings['camera_fps'] is not None:
+        cap.set(cv.CAP_PROP_FPS, face_aimer_settings['camera_fps'])
+    if face_aimer_settings['camera_buffer_size'] is not None:
+        cap.set(cv.CAP_PROP_BUFFERSIZE, face_aimer_settings['camera_buffer_size'])
+    if face_aimer_settings['camera_raw_yuyv'] and fourcc == 'YUYV':
+        # hand over the raw YUYV frames, tracking reads the luma channel straight out of them
+        cap.set(cv.CAP_PROP_CONVERT_RGB, 0)
+
+    # drivers quietly fall back to what they support, so report what we actually got
+    fourcc = int(cap.get(cv.CAP_PROP_FOURCC)).to_bytes(4, 'little').decode(errors='replace')
+    print(f"Camera {index}: {int(cap.get(cv.CAP_PROP_FRAME_WIDTH))}x{int(cap.get(cv.CAP_PROP_FRAME_HEIGHT))} "
+          f"@ {cap.get(cv.CAP_PROP_FPS):.0f} fps, {fourcc}")
+    return cap
+
+
+def lumaImage(frame, dst=None):
+    # grayscale view of a BGR, YUYV (2 channel) or already gray frame, without copying where possible
+    if frame.ndim == 2:
+        gray = frame
+    elif frame.shape[2] == 2:
+        # YUYV keeps luma in the first channel of every pixel
+        gray = frame[:, :, 0]
+    else:
+        return cv.cvtColor(frame, cv.COLOR_BGR2GRAY, dst=dst)
+
+    if dst is not None:
+        np.copyto(dst, gray)
+        return dst
+    return gray
+
+
+def bgrImage(frame, dst=None):
+    # BGR version of a frame for display, BGR frames are returned as they are
+    if frame.ndim == 2:
+        return cv.cvtColor(frame, cv.COLOR_GRAY2BGR, dst=dst)
+    elif frame.shape[2] == 2:
+        return cv.cvtColor(frame, cv.COLOR_YUV2BGR_YUYV, dst=dst)
+    return frame
+
+
+def openFrameSource(source, realtime=False, loop=False):
+    # camera index, video file, folder of frames or .npy frame dump
+    if isinstance(source, int) or (isinstance(source, str) and source.isdigit()):
+        return openCamera(int(source))
+    if os.path.isdir(source) or source.lower().endswith('.npy'):
+        return frameDumpSource(source, realtime=realtime, loop=loop)
+    return videoFileSource(source, realtime=realtime, loop=loop)
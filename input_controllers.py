@@ -1,35 +1,36 @@
-import queue
+import threading
 from collections import deque
 from math import copysign, sqrt
-from time import perf_counter, sleep
-
-import win32api
-import win32con
-from pynput.mouse import Controller
+from time import perf_counter
 
+from output_backends import makeOutputBackend
+from perf_stats import perf
+from pose_filters import makePoseFilter
 from settings import face_aimer_settings
+from tick_scheduler import tickScheduler
 
 
 class mouseController():
 
-    def __init__(self, pose_point_queue, pose_dimensions, coord_mins):
+    def __init__(self, pose_channel, pose_dimensions, screen_mapping, output=None):
         # input parameters
-        self.x_min = coord_mins[0]
-        self.y_min = coord_mins[1]
+        self.screen_mapping = screen_mapping
         self.pose_width = pose_dimensions[0]
         self.pose_height = pose_dimensions[1]
         self.pose_center = pose_dimensions[2]
-        self.pose_queue = pose_point_queue
+        self.pose_channel = pose_channel
 
         # import settings
-        self.res_x = face_aimer_settings['res_x']
-        self.res_y = face_aimer_settings['res_x']
         self.refresh_time = 1/face_aimer_settings['mouse_refresh_rate']
+        self.scheduler = tickScheduler(face_aimer_settings['mouse_refresh_rate'])
         self.move_factor = face_aimer_settings['move_speed']*self.refresh_time
         self.smoothing_count = face_aimer_settings['move_smoothing']
 
-        # initialize mouse controller
-        self.mouse = Controller()
+        # predictive filter, replaces smoothCoords if one is selected
+        self.pose_filter = makePoseFilter()
+
+        # mouse output
+        self.output = output if output is not None else makeOutputBackend()
 
         # initialize variables
         self.pose_point = self.pose_center
@@ -38,37 +39,31 @@ class mouseController():
         self.offset_x = 0
         self.offset_y = 0
         self.move_allowed = False
+        self.last_seq = 0
+        self.pose_time = 0
+        self.pose_age = 0 # seconds between capturing the pose and acting on it
+        self.latency_pending = False # the first move for a new pose hasn't been made yet
 
         # initialize smoothing array
         self.smoothing_deque = deque()
         for _ in range(self.smoothing_count):
             self.smoothing_deque.appendleft((0,0))
 
-    def poseToResolution(self, pose_coord):
-        # normalize current pose coordinate
-        x_norm = (pose_coord[0]-self.x_min)/self.pose_width
-        y_norm = (pose_coord[1]-self.y_min)/self.pose_height
-
-        # scale to resolution
-        x_pix = int(x_norm * self.res_x)
-        y_pix = int(y_norm * self.res_y)
-
-        # adjust for overshoot
-        if x_pix < 0:
-            x_pix = 0
-        elif x_pix > self.res_x:
-            x_pix = self.res_x
-
-        if y_pix < 0:
-            y_pix = 0
-        elif y_pix > self.res_y:
-            y_pix = self.res_y
+    def setCalibration(self, pose_dimensions, screen_mapping):
+        # after recalibrating
+        self.screen_mapping = screen_mapping
+        self.pose_width = pose_dimensions[0]
+        self.pose_height = pose_dimensions[1]
+        self.pose_center = pose_dimensions[2]
 
-        return (x_pix, y_pix)
+    def poseToResolution(self, pose_coord):
+        # screen pixel for the pose, through the calibration's homography
+        return self.screen_mapping.toScreen(pose_coord)
 
     def updateOffset(self, smooth_coords):
-        self.offset_x = smooth_coords[0] - self.mouse.position[0]
-        self.offset_y = smooth_coords[1] - self.mouse.position[1]
+        position = self.output.position
+        self.offset_x = smooth_coords[0] - position[0]
+        self.offset_y = smooth_coords[1] - position[1]
 
     def smoothCoords(self, current_coord):
         smooth_x = 0
@@ -92,50 +87,62 @@ class mouseController():
 
         return (smooth_x, smooth_y)
 
-    def start_controller(self, stop_controller_event):
-        while(True):
-            # get start time
-            tic = perf_counter()
-
-            # exit thread if stop event is set
-            if stop_controller_event.isSet():
-                return
-
-            # check queue for new target value
-            try:
-                self.pose_point = self.pose_queue.get(False)
-                # if no face detected, stop moving
-                if self.pose_point == (-1,-1):
-                    self.pose_point = self.pose_center
-                    self.move_allowed = False
-                else:
-                    rawpixcoords = self.poseToResolution(self.pose_point) # convert pose space to screen resolution space
-                    (self.smooth_x, self.smooth_y) = self.smoothCoords(rawpixcoords) # smooth by averaging past 3 frames
-                    self.move_allowed = True             
-            except queue.Empty:
-                pass
-
-            if self.move_allowed:
-                # get updated offset from target
-                self.updateOffset((self.smooth_x, self.smooth_y))
-
-                # move mouse towards target
-                win32api.mouse_event(win32con.MOUSEEVENTF_MOVE, int(self.offset_x*self.move_factor), int(self.offset_y*self.move_factor))
-
-            # get end time
-            toc = perf_counter()
-
-            # standardize refresh rate
-            time_diff_s = toc-tic
-            if time_diff_s < self.refresh_time:
-                sleep(self.refresh_time - time_diff_s)
+    def tick(self, tic):
+        # one controller update, tic is the tick's start time
+        # check channel for new target value
+        sample = self.pose_channel.get()
+        if sample.seq != self.last_seq:
+            perf.record('pose handoff', perf_counter() - sample.put_time)
+            self.last_seq = sample.seq
+            self.pose_time = sample.timestamp
+            self.pose_point = sample.pose_point
+            self.latency_pending = True
+            # if no face detected, stop moving
+            if self.pose_point == (-1,-1):
+                self.pose_point = self.pose_center
+                self.move_allowed = False
+                self.output.reset()
+                if self.pose_filter is not None:
+                    self.pose_filter.reset()
+            elif self.pose_filter is not None:
+                self.pose_filter.update(self.pose_point, self.pose_time)
+                self.move_allowed = True
+            else:
+                rawpixcoords = self.poseToResolution(self.pose_point) # convert pose space to screen resolution space
+                (self.smooth_x, self.smooth_y) = self.smoothCoords(rawpixcoords) # smooth by averaging past 3 frames
+                self.move_allowed = True
+
+        if self.move_allowed:
+            # how old the pose we're acting on is
+            self.pose_age = tic - self.pose_time
+
+            if self.pose_filter is not None:
+                # extrapolate a fresh target for this tick
+                (self.smooth_x, self.smooth_y) = self.poseToResolution(self.pose_filter.predict(tic))
+
+            # get updated offset from target
+            self.updateOffset((self.smooth_x, self.smooth_y))
+
+            # move mouse towards target
+            self.output.move(self.offset_x*self.move_factor, self.offset_y*self.move_factor)
+            self.recordLatency()
+
+    def recordLatency(self):
+        # photon to cursor: from the driver handing over the frame to the first move made from its pose
+        if self.latency_pending:
+            perf.record('photon to cursor', perf_counter() - self.pose_time)
+            self.latency_pending = False
+
+    def idle(self):
+        # nothing to do until the next pose: no target, or the cursor is already on it
+        return not self.move_allowed or (abs(self.offset_x) < 1 and abs(self.offset_y) < 1)
 
 
 class stickController():
 
-    def __init__(self, pose_point_queue, pose_dimensions, deadzone_radius):
+    def __init__(self, pose_channel, pose_dimensions, deadzone_radius, output=None):
         # input parameters
-        self.pose_queue = pose_point_queue
+        self.pose_channel = pose_channel
         self.pose_width = pose_dimensions[0]
         self.pose_height = pose_dimensions[1]
         self.pose_center = pose_dimensions[2]
@@ -143,59 +150,151 @@ class stickController():
 
         # import settings
         self.refresh_time = 1/face_aimer_settings['stick_refresh_rate']
+        self.scheduler = tickScheduler(face_aimer_settings['stick_refresh_rate'])
         self.turn_speed_h = face_aimer_settings['turn_speed_h']
         self.turn_speed_v = face_aimer_settings['turn_speed_v']
 
+        # predictive filter, stick uses raw poses if none is selected
+        self.pose_filter = makePoseFilter()
+
+        # mouse output
+        self.output = output if output is not None else makeOutputBackend()
+
         # initialize variables
         self.pose_point = self.pose_center
         self.move_allowed = False
+        self.moving = False # the last tick was outside the deadzone
+        self.last_seq = 0
+        self.pose_time = 0
+        self.pose_age = 0 # seconds between capturing the pose and acting on it
+        self.latency_pending = False # the first move for a new pose hasn't been made yet
+
+    def setCalibration(self, pose_dimensions, deadzone_radius):
+        # after recalibrating
+        self.pose_width = pose_dimensions[0]
+        self.pose_height = pose_dimensions[1]
+        self.pose_center = pose_dimensions[2]
+        self.deadzone_radius = deadzone_radius
 
-    def start_controller(self, stop_controller_event):
-        while(True):
-            # get start time
-            tic = perf_counter()
-
-            # exit thread if stop event is set
-            if stop_controller_event.isSet():
-                return
-
-            # check queue for new value
-            try:
-                self.pose_point = self.pose_queue.get(False)
-                # if no face detected, stop moving
-                if self.pose_point == (-1,-1):
-                    self.pose_point = self.pose_center
-                    self.move_allowed = False
-                else:
-                    self.move_allowed = True
-            except queue.Empty:
-                pass
-            
-            if self.move_allowed:
-                # get distance from center of pose space
-                delta_x = self.pose_point[0] - self.pose_center[0]
-                delta_y = self.pose_point[1] - self.pose_center[1]
-
-                # get distance from deadzone
-                distance = sqrt(delta_x**2 + delta_y**2)
-                deadzone_dist = distance - self.deadzone_radius
-
-                # if outside the deadzone
-                if deadzone_dist > 0:
-                    # get sqrt of dist from center, add sign back
-                    norm_x = abs(delta_x)/self.pose_width
-                    norm_y = abs(delta_y)/self.pose_height
-                    strength_x = copysign(norm_x, delta_x)
-                    strength_y = copysign(norm_y, delta_y)
-                    # move mouse
-                    win32api.mouse_event(win32con.MOUSEEVENTF_MOVE, int(strength_x*self.turn_speed_h), int(strength_y*self.turn_speed_v))
-                else:
-                    pass
-            
-            # get end time
-            toc = perf_counter()
-
-            # standardize refresh rate
-            time_diff_s = toc-tic
-            if time_diff_s < self.refresh_time:
-                sleep(self.refresh_time - time_diff_s)
+    def tick(self, tic):
+        # one controller update, tic is the tick's start time
+        # check channel for new value
+        sample = self.pose_channel.get()
+        if sample.seq != self.last_seq:
+            perf.record('pose handoff', perf_counter() - sample.put_time)
+            self.last_seq = sample.seq
+            self.pose_time = sample.timestamp
+            self.pose_point = sample.pose_point
+            self.latency_pending = True
+            # if no face detected, stop moving
+            if self.pose_point == (-1,-1):
+                self.pose_point = self.pose_center
+                self.move_allowed = False
+                self.output.reset()
+                if self.pose_filter is not None:
+                    self.pose_filter.reset()
+            else:
+                self.move_allowed = True
+                if self.pose_filter is not None:
+                    self.pose_filter.update(sample.pose_point, self.pose_time)
+        
+        if self.move_allowed:
+            # how old the pose we're acting on is
+            self.pose_age = tic - self.pose_time
+
+            if self.pose_filter is not None:
+                # extrapolate a fresh pose for this tick
+                self.pose_point = self.pose_filter.predict(tic)
+
+            # if outside the deadzone
+            strength = self.stickStrength(self.pose_point)
+            self.moving = strength is not None
+            if self.moving:
+                # move mouse
+                self.output.move(strength[0]*self.turn_speed_h, strength[1]*self.turn_speed_v)
+                self.recordLatency()
+
+    def stickStrength(self, pose_point):
+        # stick deflection (x, y) for a pose, as a signed share of the pose space, or None inside the deadzone
+        # get distance from center of pose space
+        delta_x = pose_point[0] - self.pose_center[0]
+        delta_y = pose_point[1] - self.pose_center[1]
+
+        # get distance from deadzone
+        distance = sqrt(delta_x**2 + delta_y**2)
+        deadzone_dist = distance - self.deadzone_radius
+        if deadzone_dist <= 0:
+            return None
+
+        # get sqrt of dist from center, add sign back
+        norm_x = abs(delta_x)/self.pose_width
+        norm_y = abs(delta_y)/self.pose_height
+        return (copysign(norm_x, delta_x), copysign(norm_y, delta_y))
+
+    def recordLatency(self):
+        # photon to cursor: from the driver handing over the frame to the first move made from its pose
+        if self.latency_pending:
+            perf.record('photon to cursor', perf_counter() - self.pose_time)
+            self.latency_pending = False
+
+    def idle(self):
+        # nothing to do until the next pose: no target, or it's inside the deadzone
+        return not self.move_allowed or not self.moving
+
+
+class controllerThread():
+    # one output thread for both controllers. Ticks the selected controller at its refresh rate while it has something to do,
+    # otherwise sleeps on the pose channel until a new pose arrives. Switching controllers doesn't restart the thread
+
+    def __init__(self, pose_channel, controllers, control_mode):
+        # controllers is a dict of control mode to controller
+        self.pose_channel = pose_channel
+        self.controllers = controllers
+        self.controller = controllers[control_mode]
+        self.running = False
+        self.thread = None
+
+        # thread statistics
+        self.idle_waits = 0
+        self.switches = 0
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.controllerLoop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.pose_channel.wake()
+        if self.thread is not None:
+            self.thread.join()
+
+    def setMode(self, control_mode):
+        # takes effect on the next tick, or straight away if the thread is idle
+        self.controller = self.controllers[control_mode]
+        self.pose_channel.wake()
+
+    def controllerLoop(self):
+        controller = self.controller
+        controller.scheduler.start()
+        while self.running:
+            if self.controller is not controller:
+                # swap controllers, each keeps its own tick rate
+                controller.scheduler.stop()
+                controller = self.controller
+                controller.scheduler.start()
+                self.switches += 1
+
+            if controller.idle() and self.pose_channel.get().seq == controller.last_seq:
+                # no ticks (and no CPU) until there's a new pose, or the mode changes
+                self.idle_waits += 1
+                controller.scheduler.pause()
+                self.pose_channel.wait(controller.last_seq)
+                controller.scheduler.resume()
+                continue
+
+            controller.tick(controller.scheduler.wait())
+        controller.scheduler.stop()
+
+    def threadStats(self):
+        return f"Controller thread: {self.idle_waits} idle waits, {self.switches} mode switches"
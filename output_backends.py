@@ -0,0 +1,177 @@
+import os
+import sys
+from time import perf_counter
+
+from perf_stats import perf
+from settings import face_aimer_settings
+
+
+class outputBackend():
+    # relative mouse output, carries sub-pixel remainders between moves and skips moves too small to send
+
+    def __init__(self):
+        self.min_step = face_aimer_settings['output_min_step']
+        self.remainder_x = 0
+        self.remainder_y = 0
+
+        # output statistics
+        self.sent_count = 0
+        self.coalesced_count = 0
+
+        # flight recorder every move is logged to, if set
+        self.recorder = None
+
+    def move(self, dx, dy):
+        # dx and dy can be fractional, whatever isn't sent carries over to the next move
+        x = self.remainder_x + dx
+        y = self.remainder_y + dy
+        step_x = int(x)
+        step_y = int(y)
+
+        if abs(step_x) < self.min_step and abs(step_y) < self.min_step:
+            # wouldn't move the cursor (enough), hold it back and merge it into the next move
+            self.remainder_x = x
+            self.remainder_y = y
+            self.coalesced_count += 1
+            if self.recorder is not None:
+                self.recorder.recordMove(dx, dy, 0, 0)
+            return
+
+        self.remainder_x = x - step_x
+        self.remainder_y = y - step_y
+        tic = perf_counter()
+        self.sendMove(step_x, step_y)
+        perf.since('output', tic)
+        self.sent_count += 1
+        if self.recorder is not None:
+            self.recorder.recordMove(dx, dy, step_x, step_y)
+
+    def reset(self):
+        # drop any held back movement
+        self.remainder_x = 0
+        self.remainder_y = 0
+
+    @property
+    def position(self):
+        # current cursor position, through pynput unless the backend can tell us itself
+        if not hasattr(self, 'pointer'):
+            from pynput.mouse import Controller
+            self.pointer = Controller()
+        return self.pointer.position
+
+    def outputStats(self):
+        total = self.sent_count + self.coalesced_count
+        if not total:
+            return "Output: no moves"
+        return f"Output ({type(self).__name__}): {self.sent_count} moves sent, {self.coalesced_count} of {total} merged ({self.coalesced_count/total:.1%})"
+
+    def close(self):
+        pass
+
+
+class win32Backend(outputBackend):
+
+    def __init__(self):
+        import win32api
+        import win32con
+
+        super().__init__()
+        self.mouse_event = win32api.mouse_event
+        self.get_cursor_pos = win32api.GetCursorPos
+        self.move_flag = win32con.MOUSEEVENTF_MOVE
+
+    def sendMove(self, dx, dy):
+        # mouse_event is read by games as raw input
+        self.mouse_event(self.move_flag, dx, dy)
+
+    @property
+    def position(self):
+        return self.get_cursor_pos()
+
+
+class uinputBackend(outputBackend):
+    # virtual mouse device, works under X11, Wayland and games reading evdev directly. Needs write access to /dev/uinput
+
+    def __init__(self):
+        from evdev import UInput, ecodes
+
+        super().__init__()
+        self.ecodes = ecodes
+        # buttons are needed for the device to be treated as a mouse
+        self.device = UInput({ecodes.EV_REL: [ecodes.REL_X, ecodes.REL_Y],
+                              ecodes.EV_KEY: [ecodes.BTN_LEFT, ecodes.BTN_RIGHT]},
+                             name='face-aimer-mouse')
+
+    def sendMove(self, dx, dy):
+        if dx:
+            self.device.write(self.ecodes.EV_REL, self.ecodes.REL_X, dx)
+        if dy:
+            self.device.write(self.ecodes.EV_REL, self.ecodes.REL_Y, dy)
+        self.device.syn()
+
+    def close(self):
+        self.device.close()
+
+
+class x11Backend(outputBackend):
+
+    def __init__(self):
+        from Xlib import display
+
+        super().__init__()
+        self.display = display.Display()
+        self.root = self.display.screen().root
+
+    def sendMove(self, dx, dy):
+        # warping without a source window moves the pointer relative to where it is
+        self.display.warp_pointer(dx, dy)
+        self.display.flush()
+
+    @property
+    def position(self):
+        pointer = self.root.query_pointer()
+        return (pointer.root_x, pointer.root_y)
+
+    def close(self):
+        self.display.close()
+
+
+class recorderBackend(outputBackend):
+    # keeps the moves in memory instead of sending them, for tests and benchmarks
+
+    def __init__(self, start_position=(0, 0)):
+        super().__init__()
+        self.moves = [] # (time, dx, dy)
+        self.cursor = start_position
+
+    def sendMove(self, dx, dy):
+        self.moves.append((perf_counter(), dx, dy))
+        self.cursor = (self.cursor[0] + dx, self.cursor[1] + dy)
+
+    @property
+    def position(self):
+        return self.cursor
+
+
+def makeOutputBackend(backend_name=None):
+    # build the output backend selected in settings
+    if backend_name is None:
+        backend_name = face_aimer_settings['output_backend']
+
+    if backend_name == 'auto':
+        if sys.platform == 'win32':
+            backend_name = 'win32'
+        elif os.access('/dev/uinput', os.W_OK):
+            backend_name = 'uinput'
+        else:
+            backend_name = 'x11'
+
+    if backend_name == 'win32':
+        return win32Backend()
+    elif backend_name == 'uinput':
+        return uinputBackend()
+    elif backend_name == 'x11':
+        return x11Backend()
+    elif backend_name == 'recorder':
+        return recorderBackend()
+    raise ValueError(f"Unknown output backend '{backend_name}'")
@@ -0,0 +1,109 @@
+import csv
+import json
+import os
+from time import perf_counter, time
+
+import numpy as np
+
+from settings import face_aimer_settings
+
+
+class stageTimer():
+    # rolling window of one stage's recent durations, recording is a single array write
+
+    def __init__(self, window):
+        self.samples = np.zeros(window)
+        self.index = 0
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, duration):
+        self.samples[self.index] = duration
+        self.index = (self.index + 1) % len(self.samples)
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+
+    def summary(self):
+        # percentiles over the window, mean & max since the start (ms)
+        recent = self.samples[:min(self.count, len(self.samples))]
+        (p50, p95, p99) = np.percentile(recent, [50, 95, 99])*1000
+        return {'count': self.count, 'mean_ms': self.total/self.count*1000,
+                'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99), 'max_ms': self.max*1000}
+
+
+class perfStats():
+    # per-stage timings from every thread. Each stage is only recorded from one thread, so there's no locking
+
+    def __init__(self):
+        self.window = face_aimer_settings['perf_window']
+        self.export_file = face_aimer_settings['perf_export_file']
+        self.export_interval = face_aimer_settings['perf_export_interval']
+        self.hud_interval = 0.5 # seconds between refreshing the overlay's numbers
+
+        self.stages = {}
+        self.next_export = perf_counter() + self.export_interval
+        self.next_hud = 0
+        self.hud_lines = ()
+
+    def record(self, stage, duration):
+        timer = self.stages.get(stage)
+        if timer is None:
+            timer = self.stages[stage] = stageTimer(self.window)
+        timer.record(duration)
+
+    def since(self, stage, tic):
+        # records the time since tic, returns now so the next stage can start from it
+        now = perf_counter()
+        self.record(stage, now - tic)
+        return now
+
+    def summary(self):
+        # copy the stage list, other threads may add stages while we read
+        return {stage: timer.summary() for (stage, timer) in list(self.stages.items()) if timer.count}
+
+    def hudLines(self):
+        # overlay text, refreshed a couple of times a second rather than every frame
+        now = perf_counter()
+        if now >= self.next_hud:
+            self.next_hud = now + self.hud_interval
+            self.hud_lines = tuple(f"{stage}: p50 {stats['p50_ms']:.2f} p95 {stats['p95_ms']:.2f} max {stats['max_ms']:.2f} ms"
+                                   for (stage, stats) in self.summary().items())
+        return self.hud_lines
+
+    def exportIfDue(self):
+        # append a snapshot to the export file every export_interval seconds, csv rows or json lines by file extension
+        if not self.export_file or perf_counter() < self.next_export:
+            return
+        self.next_export = perf_counter() + self.export_interval
+        summary = self.summary()
+        timestamp = time()
+
+        if self.export_file.lower().endswith('.csv'):
+            new_file = not os.path.exists(self.export_file)
+            with open(self.export_file, 'a', newline='') as f:
+                writer = csv.writer(f)
+                if new_file:
+                    writer.writerow(['time', 'stage', 'count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'])
+                for (stage, stats) in summary.items():
+                    writer.writerow([f"{timestamp:.3f}", stage] + [round(value, 4) for value in stats.values()])
+        else:
+            with open(self.export_file, 'a') as f:
+                f.write(json.dumps({'time': timestamp, 'stages': {stage: {key: round(value, 4) for (key, value) in stats.items()}
+                                                                  for (stage, stats) in summary.items()}}) + '\n')
+
+    def perfStats(self):
+        summary = self.summary()
+        if not summary:
+            return "Performance: nothing timed"
+        stats = f"Performance (ms, percentiles over the last {self.window} samples):"
+        for (stage, stage_stats) in summary.items():
+            stats += (f"\n  {stage}: {stage_stats['count']} samples, mean {stage_stats['mean_ms']:.3f}, p50 {stage_stats['p50_ms']:.3f}, "
+                      f"p95 {stage_stats['p95_ms']:.3f}, p99 {stage_stats['p99_ms']:.3f}, max {stage_stats['max_ms']:.3f}")
+        return stats
+
+
+# shared by every module that times a stage
+perf = perfStats()
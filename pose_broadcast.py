@@ -0,0 +1,177 @@
+import os
+import socket
+import struct
+from collections import namedtuple
+from multiprocessing import resource_tracker, shared_memory
+from time import perf_counter, sleep
+
+import numpy as np
+
+from settings import face_aimer_settings
+
+# one pose, little endian, 88 bytes: magic, sequence number, capture time & publish time (perf_counter, which is the same clock
+# for every process on the machine), pose point (x, y) in the mirrored image as the preview shows it, rvec, tvec, face found.
+# rvec & tvec are NaN when there's no face
+pose_struct = struct.Struct('<4sQdd2f24s24s?3x')
+magic = b'FAP1'
+# the shared memory slot is a seqlock: a counter that's odd while the pose after it is being written
+seqlock_struct = struct.Struct('<Q')
+slot_size = seqlock_struct.size + pose_struct.size
+
+broadcastSample = namedtuple('broadcastSample', ['seq', 'timestamp', 'publish_time', 'pose_point', 'rvec', 'tvec', 'found'])
+
+no_vector = np.full(3, np.nan).tobytes()
+
+
+def unpackSample(packet):
+    (packet_magic, seq, timestamp, publish_time, x, y, rvec, tvec, found) = pose_struct.unpack(packet)
+    if packet_magic != magic:
+        return None
+    return broadcastSample(seq, timestamp, publish_time, (x, y), np.frombuffer(rvec), np.frombuffer(tvec), found)
+
+
+class posePublisher():
+    # sends every pose to other processes on the machine, over UDP and/or a shared memory slot
+
+    def __init__(self, port=None, shm_name=None, host=None):
+        if port is None:
+            port = face_aimer_settings['pose_broadcast_port']
+        if shm_name is None:
+            shm_name = face_aimer_settings['pose_broadcast_shm']
+        if host is None:
+            host = face_aimer_settings['pose_broadcast_host']
+
+        self.packet = bytearray(pose_struct.size)
+        self.seq = 0
+
+        # udp, never blocks the tracking loop. A datagram that can't be sent is dropped
+        self.sock = None
+        self.address = (host, port)
+        if port:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.setblocking(False)
+
+        # shared memory, readers always see the newest pose
+        self.shm = None
+        if shm_name:
+            try:
+                self.shm = shared_memory.SharedMemory(name=shm_name, create=True, size=slot_size)
+            except FileExistsError:
+                # left behind by a publisher that didn't close, take it over
+                stale = shared_memory.SharedMemory(name=shm_name)
+                stale.close()
+                stale.unlink()
+                self.shm = shared_memory.SharedMemory(name=shm_name, create=True, size=slot_size)
+            self.shm.buf[:slot_size] = bytes(slot_size)
+            self.lock_count = 0
+
+        # publisher statistics
+        self.publish_count = 0
+        self.publish_total = 0
+        self.dropped_count = 0
+
+    def publish(self, timestamp, pose_point, rot_vect, trans_vect, found):
+        # timestamp is the frame's capture time, the vectors can be None if no pose was solved
+        tic = perf_counter()
+        self.seq += 1
+        pose_struct.pack_into(self.packet, 0, magic, self.seq, timestamp, tic, pose_point[0], pose_point[1],
+                              no_vector if rot_vect is None else rot_vect.tobytes(),
+                              no_vector if trans_vect is None else trans_vect.tobytes(), found)
+
+        if self.sock is not None:
+            try:
+                self.sock.sendto(self.packet, self.address)
+            except OSError:
+                # socket buffer full or nobody listening, nobody will miss an old pose
+                self.dropped_count += 1
+
+        if self.shm is not None:
+            # odd while writing, readers that catch it mid-write try again
+            self.lock_count += 1
+            seqlock_struct.pack_into(self.shm.buf, 0, self.lock_count)
+            self.shm.buf[seqlock_struct.size:slot_size] = self.packet
+            self.lock_count += 1
+            seqlock_struct.pack_into(self.shm.buf, 0, self.lock_count)
+
+        self.publish_count += 1
+        self.publish_total += perf_counter() - tic
+
+    def publisherStats(self):
+        if not self.publish_count:
+            return "Pose broadcast: nothing published"
+        return (f"Pose broadcast: {self.publish_count} poses, {self.publish_total/self.publish_count*1e6:.1f} us each, "
+                f"{self.dropped_count} udp datagrams dropped")
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+
+
+class udpPoseSubscriber():
+    # reference subscriber for the udp broadcast
+
+    def __init__(self, port=None, host=None):
+        if port is None:
+            port = face_aimer_settings['pose_broadcast_port']
+        if host is None:
+            host = face_aimer_settings['pose_broadcast_host']
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+
+    def receive(self, timeout=None):
+        # the next pose, or None if none arrives within timeout seconds
+        self.sock.settimeout(timeout)
+        try:
+            packet = self.sock.recv(pose_struct.size)
+        except socket.timeout:
+            return None
+        return unpackSample(packet)
+
+    def close(self):
+        self.sock.close()
+
+
+class shmPoseSubscriber():
+    # reference subscriber for the shared memory slot, polls for new poses
+
+    def __init__(self, shm_name=None, poll_interval=0.0005):
+        if shm_name is None:
+            shm_name = face_aimer_settings['pose_broadcast_shm']
+        self.shm = shared_memory.SharedMemory(name=shm_name)
+        if os.name == 'posix':
+            # python unlinks shared memory a process attached to when it exits, it belongs to the publisher
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+        self.poll_interval = poll_interval # seconds between checks, 0 spins
+        self.last_seq = 0
+        self.retries = 0 # reads that caught the publisher mid-write
+
+    def read(self):
+        # the newest pose, None before the first one. Never blocks for more than a write
+        while True:
+            (before,) = seqlock_struct.unpack_from(self.shm.buf, 0)
+            if before & 1 == 0:
+                packet = bytes(self.shm.buf[seqlock_struct.size:slot_size])
+                (after,) = seqlock_struct.unpack_from(self.shm.buf, 0)
+                if before == after:
+                    return unpackSample(packet) if before else None
+            # let the publisher finish
+            self.retries += 1
+            sleep(0)
+
+    def receive(self, timeout=None):
+        # waits for a pose newer than the last one received, None on timeout
+        deadline = None if timeout is None else perf_counter() + timeout
+        while True:
+            sample = self.read()
+            if sample is not None and sample.seq != self.last_seq:
+                self.last_seq = sample.seq
+                return sample
+            if deadline is not None and perf_counter() > deadline:
+                return None
+            sleep(self.poll_interval)
+
+    def close(self):
+        self.shm.close()
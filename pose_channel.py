@@ -0,0 +1,41 @@
+import threading
+from collections import namedtuple
+from time import perf_counter
+
+# one pose update: sequence number, capture time (perf_counter), pose point ((-1, -1) if no target) and when it was put in the channel
+poseSample = namedtuple('poseSample', ['seq', 'timestamp', 'pose_point', 'put_time'])
+
+
+class poseChannel():
+
+    def __init__(self):
+        # only the newest sample is kept, writers overwrite it
+        self.write_lock = threading.Lock()
+        self.new_sample = threading.Condition(self.write_lock)
+        self.sample = poseSample(0, 0, (-1, -1), 0)
+        self.wakeups = 0
+
+    def put(self, pose_point, timestamp):
+        with self.write_lock:
+            if pose_point == (-1, -1) and self.sample.pose_point == (-1, -1):
+                # still no target, nothing for a waiting reader to do
+                return
+            self.sample = poseSample(self.sample.seq + 1, timestamp, pose_point, perf_counter())
+            self.new_sample.notify_all()
+
+    def get(self):
+        # never blocks, readers compare seq to tell if the sample is new
+        return self.sample
+
+    def wait(self, last_seq, timeout=None):
+        # blocks until there's a sample newer than last_seq or wake() is called, returns the newest sample
+        with self.write_lock:
+            wakeups = self.wakeups
+            self.new_sample.wait_for(lambda: self.sample.seq != last_seq or self.wakeups != wakeups, timeout)
+            return self.sample
+
+    def wake(self):
+        # wakes up waiting readers without a new sample
+        with self.write_lock:
+            self.wakeups += 1
+            self.new_sample.notify_all()
@@ -0,0 +1,155 @@
+from collections import deque
+from math import pi
+
+from settings import face_aimer_settings
+
+
+class movingAverageFilter():
+    # same averaging as mouseController.smoothCoords, holds the last value between camera frames
+
+    def __init__(self, smoothing_count):
+        self.smoothing_count = smoothing_count
+        self.reset()
+
+    def reset(self):
+        self.smoothing_deque = deque([(0, 0)]*self.smoothing_count)
+        self.point = None
+
+    def update(self, point, timestamp):
+        smooth_x = sum(val[0] for val in self.smoothing_deque) + point[0]
+        smooth_y = sum(val[1] for val in self.smoothing_deque) + point[1]
+        self.point = (smooth_x/(self.smoothing_count + 1), smooth_y/(self.smoothing_count + 1))
+        self.smoothing_deque.pop()
+        self.smoothing_deque.appendleft(self.point)
+
+    def predict(self, timestamp):
+        return self.point
+
+
+class oneEuroFilter():
+    # speed-adaptive low pass filter (Casiez et al. 2012), extrapolates along its velocity estimate between frames
+
+    def __init__(self, min_cutoff, beta, d_cutoff, max_extrapolation):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.max_extrapolation = max_extrapolation
+        self.reset()
+
+    def reset(self):
+        self.last_time = None
+        self.point = None
+        self.velocity = (0, 0)
+
+    def smoothingFactor(self, cutoff, dt):
+        tau = 1/(2*pi*cutoff)
+        return 1/(1 + tau/dt)
+
+    def update(self, point, timestamp):
+        if self.last_time is None:
+            self.last_time = timestamp
+            self.point = point
+            self.velocity = (0, 0)
+            return
+
+        dt = max(timestamp - self.last_time, 1e-6)
+        self.last_time = timestamp
+
+        new_point = []
+        new_velocity = []
+        for axis in range(2):
+            # filter the velocity
+            raw_velocity = (point[axis] - self.point[axis])/dt
+            a_d = self.smoothingFactor(self.d_cutoff, dt)
+            velocity = a_d*raw_velocity + (1 - a_d)*self.velocity[axis]
+
+            # the faster the head moves, the less we smooth
+            cutoff = self.min_cutoff + self.beta*abs(velocity)
+            a = self.smoothingFactor(cutoff, dt)
+            new_point.append(a*point[axis] + (1 - a)*self.point[axis])
+            new_velocity.append(velocity)
+
+        self.point = tuple(new_point)
+        self.velocity = tuple(new_velocity)
+
+    def predict(self, timestamp):
+        if self.point is None:
+            return None
+        dt = min(max(timestamp - self.last_time, 0), self.max_extrapolation)
+        return (self.point[0] + self.velocity[0]*dt, self.point[1] + self.velocity[1]*dt)
+
+
+class kalmanFilter():
+    # constant velocity kalman filter per axis, extrapolates its state between frames
+
+    def __init__(self, process_noise, measurement_noise, max_extrapolation):
+        self.process_noise = process_noise # acceleration noise density, px^2/s^3
+        self.measurement_noise = measurement_noise # landmark noise variance, px^2
+        self.max_extrapolation = max_extrapolation
+        self.reset()
+
+    def reset(self):
+        self.last_time = None
+        # per axis [position, velocity] and covariance (pos-pos, pos-vel, vel-vel)
+        self.state = None
+        self.covariance = None
+
+    def update(self, point, timestamp):
+        if self.last_time is None:
+            self.last_time = timestamp
+            self.state = [[point[0], 0], [point[1], 0]]
+            self.covariance = [[self.measurement_noise, 0, 1e6], [self.measurement_noise, 0, 1e6]]
+            return
+
+        dt = max(timestamp - self.last_time, 1e-6)
+        self.last_time = timestamp
+        q = self.process_noise
+
+        for axis in range(2):
+            (pos, vel) = self.state[axis]
+            (p00, p01, p11) = self.covariance[axis]
+
+            # predict forward to the measurement
+            pos += vel*dt
+            p00 += dt*(2*p01 + dt*p11) + q*dt**3/3
+            p01 += dt*p11 + q*dt**2/2
+            p11 += q*dt
+
+            # correct with the measurement
+            innovation = point[axis] - pos
+            s = p00 + self.measurement_noise
+            k0 = p00/s
+            k1 = p01/s
+            pos += k0*innovation
+            vel += k1*innovation
+            p11 -= k1*p01
+            p01 *= (1 - k0)
+            p00 *= (1 - k0)
+
+            self.state[axis] = [pos, vel]
+            self.covariance[axis] = [p00, p01, p11]
+
+    def predict(self, timestamp):
+        if self.state is None:
+            return None
+        dt = min(max(timestamp - self.last_time, 0), self.max_extrapolation)
+        return (self.state[0][0] + self.state[0][1]*dt, self.state[1][0] + self.state[1][1]*dt)
+
+
+def makePoseFilter(filter_name=None):
+    # build the pose filter selected in settings, None keeps the controllers' own smoothing
+    if filter_name is None:
+        filter_name = face_aimer_settings['pose_filter']
+    max_extrapolation = face_aimer_settings['filter_max_extrapolation']
+
+    if filter_name == 'none':
+        return None
+    elif filter_name == 'moving_average':
+        return movingAverageFilter(face_aimer_settings['move_smoothing'])
+    elif filter_name == 'one_euro':
+        return oneEuroFilter(face_aimer_settings['one_euro_min_cutoff'], face_aimer_settings['one_euro_beta'],
+                             face_aimer_settings['one_euro_d_cutoff'], max_extrapolation)
+    elif filter_name == 'kalman':
+        return kalmanFilter(face_aimer_settings['kalman_process_noise'], face_aimer_settings['kalman_measurement_noise'],
+                            max_extrapolation)
+    raise ValueError(f"Unknown pose filter '{filter_name}'")
@@ -0,0 +1,141 @@
+from time import perf_counter
+
+import cv2 as cv
+import numpy as np
+
+from perf_stats import perf
+from resources.facial_points_3d import model_points, stable_landmarks
+from settings import face_aimer_settings
+
+# PnP algorithms selectable from settings
+pnp_methods = {
+    'iterative' : cv.SOLVEPNP_ITERATIVE,
+    'epnp' : cv.SOLVEPNP_EPNP,
+    'sqpnp' : cv.SOLVEPNP_SQPNP,
+}
+
+
+class poseSolver():
+
+    def __init__(self, camera_matrix, dist_coeffs):
+        # camera parameters
+        self.camera_matrix = camera_matrix
+        self.dist_coeffs = dist_coeffs
+
+        # import settings
+        self.method = pnp_methods[face_aimer_settings['pnp_method']]
+        self.warm_start = face_aimer_settings['pnp_warm_start'] and self.method == cv.SOLVEPNP_ITERATIVE
+        self.reset_error = face_aimer_settings['pnp_reset_error']
+        self.compare = face_aimer_settings['pnp_compare']
+
+        # landmarks to solve on
+        subset = face_aimer_settings['pnp_landmarks']
+        if subset == 'all':
+            self.landmark_idx = None
+        elif subset == 'stable':
+            self.landmark_idx = np.array(stable_landmarks)
+        else:
+            self.landmark_idx = np.array(subset)
+        self.model_points = model_points if self.landmark_idx is None else model_points[self.landmark_idx]
+
+        # point the pose is projected out to, in front of the nose
+        self.pose_axis = np.array([[0.0, 0.0, 1000.0]])
+
+        # output arrays reused between frames
+        self.image_points = None if self.landmark_idx is None else np.zeros((len(self.landmark_idx), 2), dtype=np.float32)
+        self.projected_points = None
+        self.projected_pose = None
+        self.jacobian = None # projectPoints always computes one, it's the biggest of the lot
+
+        # previous solution, used as the starting guess for the next frame
+        self.rot_vect = None
+        self.trans_vect = None
+        self.error = 0
+
+        # solver statistics
+        self.solve_count = 0
+        self.solve_time = 0
+        self.error_total = 0
+        self.reset_count = 0
+        # comparison against a cold full solve
+        self.reference_time = 0
+        self.reference_diff_total = 0
+        self.reference_diff_max = 0
+
+    def reprojectionError(self, object_points, image_points, rot_vect, trans_vect):
+        # mean distance (px) between the landmarks and the model projected with the solved pose
+        (self.projected_points, self.jacobian) = cv.projectPoints(object_points, rot_vect, trans_vect, self.camera_matrix, self.dist_coeffs,
+                                                                  self.projected_points, self.jacobian)
+        return np.linalg.norm(self.projected_points.reshape(-1, 2) - image_points, axis=1).mean()
+
+    def reset(self):
+        # forget the previous pose, the next solve starts from scratch
+        self.rot_vect = None
+        self.trans_vect = None
+
+    def solve(self, landmarks):
+        # solves the head pose for the landmarks, returns (rot_vect, trans_vect, reprojection error)
+        tic = perf_counter()
+        image_points = landmarks if self.landmark_idx is None else np.take(landmarks, self.landmark_idx, axis=0, out=self.image_points)
+
+        if self.warm_start and self.rot_vect is not None:
+            # start from last frame's pose, the head barely moves between frames
+            (ok, rot_vect, trans_vect) = cv.solvePnP(self.model_points, image_points, self.camera_matrix, self.dist_coeffs,
+                                                     rvec=self.rot_vect, tvec=self.trans_vect, useExtrinsicGuess=True,
+                                                     flags=cv.SOLVEPNP_ITERATIVE)
+        else:
+            (ok, rot_vect, trans_vect) = cv.solvePnP(self.model_points, image_points, self.camera_matrix, self.dist_coeffs,
+                                                     flags=self.method)
+        error = self.reprojectionError(self.model_points, image_points, rot_vect, trans_vect) if ok else np.inf
+
+        if error > self.reset_error:
+            # bad fit, solve again from scratch on all the landmarks
+            self.reset_count += 1
+            (ok, rot_vect, trans_vect) = cv.solvePnP(model_points, landmarks, self.camera_matrix, self.dist_coeffs)
+            error = self.reprojectionError(model_points, landmarks, rot_vect, trans_vect)
+
+        # don't warm start from a bad fit
+        if error > self.reset_error:
+            self.reset()
+        else:
+            self.rot_vect = rot_vect
+            self.trans_vect = trans_vect
+        self.error = error
+
+        # update statistics
+        self.solve_time += perf.since('solvePnP', tic) - tic
+        self.solve_count += 1
+        self.error_total += error
+
+        if self.compare:
+            self.compareReference(landmarks, rot_vect, trans_vect)
+
+        return (rot_vect, trans_vect, error)
+
+    def projectPose(self, rot_vect, trans_vect):
+        # get pose point projection in terms of image
+        (self.projected_pose, _) = cv.projectPoints(self.pose_axis, rot_vect, trans_vect, self.camera_matrix, self.dist_coeffs,
+                                                    self.projected_pose)
+        return (self.projected_pose[0][0][0], self.projected_pose[0][0][1])
+
+    def compareReference(self, landmarks, rot_vect, trans_vect):
+        # solve from scratch on all the landmarks, measure how far the pose point moved
+        tic = perf_counter()
+        (_, ref_rot_vect, ref_trans_vect) = cv.solvePnP(model_points, landmarks, self.camera_matrix, self.dist_coeffs)
+        self.reference_time += perf_counter() - tic
+
+        (x, y) = self.projectPose(rot_vect, trans_vect)
+        (ref_x, ref_y) = self.projectPose(ref_rot_vect, ref_trans_vect)
+        diff = np.hypot(x - ref_x, y - ref_y)
+        self.reference_diff_total += diff
+        self.reference_diff_max = max(self.reference_diff_max, diff)
+
+    def solverStats(self):
+        if not self.solve_count:
+            return "Pose solver: no frames solved"
+        stats = (f"Pose solver: {self.solve_time/self.solve_count*1000:.3f} ms/frame, "
+                 f"mean reprojection error {self.error_total/self.solve_count:.2f} px, {self.reset_count} resets")
+        if self.compare:
+            stats += (f" | full solve {self.reference_time/self.solve_count*1000:.3f} ms/frame, pose point diff "
+                      f"mean {self.reference_diff_total/self.solve_count:.2f} px, max {self.reference_diff_max:.2f} px")
+        return stats
@@ -0,0 +1,238 @@
+import queue
+import threading
+from collections import namedtuple
+from time import perf_counter, sleep
+
+import cv2 as cv
+import numpy as np
+
+from frame_sources import bgrImage
+from perf_stats import perf
+from settings import face_aimer_settings
+
+# everything needed to draw one preview frame. frame and landmarks are as the camera sees them, the rest is mirrored
+previewState = namedtuple('previewState', ['frame', 'landmarks', 'nose_point', 'pose_point', 'pose_center',
+                                           'control_mode', 'deadzone_radius', 'text_lines', 'debug_lines', 'perf_lines'])
+
+
+class previewPainter():
+
+    def __init__(self):
+        # import settings
+        self.marker_color = face_aimer_settings['marker_color_bgr']
+        self.gaze_line_color = face_aimer_settings['gaze_line_color_bgr']
+        self.deadzone_color = face_aimer_settings['deadzone_color_bgr']
+        self.landmarks_color = face_aimer_settings['facial_landmarks_color_bgr']
+
+        # text settings
+        self.font_face = cv.FONT_HERSHEY_PLAIN
+        self.font_scale = 0.85
+        self.font_color = (0, 0, 0)
+        self.font_thickness = 1
+        self.font_linetype = cv.LINE_AA
+
+        # text line positions, spaced by the height of the text
+        self.text_origin = (10, 10)
+        (_, self.text_height), _ = cv.getTextSize("'ESC' to quit", self.font_face, self.font_scale, self.font_thickness)
+        self.line_spacing = self.text_height*1.4
+
+        # rendered text layers, keyed by the lines and frame width
+        self.text_layers = {}
+
+        # pixel offsets that make up one landmark dot
+        self.dot_offsets = np.array([(0, 0), (1, 0), (-1, 0), (0, 1), (0, -1)])
+
+        # the preview is drawn into the same buffer every frame
+        self.display_buffer = None
+
+    def textLayer(self, text_lines, frame_width):
+        # render the text once into a mask, reuse it until the text changes
+        key = (text_lines, frame_width)
+        if key not in self.text_layers:
+            if len(self.text_layers) > 16:
+                self.text_layers.clear()
+            layer_height = int(self.text_origin[1] + self.line_spacing*len(text_lines) + self.text_height)
+            mask = np.zeros((layer_height, frame_width), dtype=np.uint8)
+            for i, (text, font_scale) in enumerate(text_lines):
+                position = (self.text_origin[0], int(self.text_origin[1] + self.line_spacing*i))
+                cv.putText(mask, text, position, self.font_face, font_scale, 255, self.font_thickness, self.font_linetype)
+            self.text_layers[key] = np.nonzero(mask > 127)
+        return self.text_layers[key]
+
+    def drawText(self, frame, text_lines):
+        # text_lines is a tuple of (text, font scale) pairs
+        (rows, cols) = self.textLayer(text_lines, frame.shape[1])
+        frame[rows, cols] = self.font_color
+
+    def displayFrame(self, frame):
+        # mirrored BGR frame to draw on, the camera frame itself is left alone. Only good until the next call
+        shape = frame.shape[:2] + (3,)
+        if self.display_buffer is None or self.display_buffer.shape != shape:
+            self.display_buffer = np.empty(shape, dtype=np.uint8)
+        # gray & YUYV frames are converted into the buffer and flipped in place
+        bgr = bgrImage(frame, dst=self.display_buffer)
+        return cv.flip(bgr, 1, dst=self.display_buffer)
+
+    def drawLandmarks(self, frame, landmarks):
+        # draw all the landmark dots in one go, mirrored to match the frame
+        landmarks = landmarks.astype(np.int32)
+        landmarks[:, 0] = frame.shape[1] - 1 - landmarks[:, 0]
+        points = (landmarks[:, None, :] + self.dot_offsets[None, :, :]).reshape(-1, 2)
+        np.clip(points[:, 0], 0, frame.shape[1] - 1, out=points[:, 0])
+        np.clip(points[:, 1], 0, frame.shape[0] - 1, out=points[:, 1])
+        frame[points[:, 1], points[:, 0]] = self.landmarks_color
+
+    def draw(self, state):
+        frame = self.displayFrame(state.frame)
+
+        # draw controls & status text
+        if state.text_lines:
+            self.drawText(frame, state.text_lines)
+
+        # draw performance stats along the bottom, face or no face
+        if state.perf_lines:
+            # dark box behind the lines so they read on any background
+            width = max(cv.getTextSize(line, cv.FONT_HERSHEY_SIMPLEX, 0.45, 1)[0][0] for line in state.perf_lines)
+            top = frame.shape[0] - 18*len(state.perf_lines) - 8
+            frame[top:, :width + 16] //= 3
+        for i, line in enumerate(reversed(state.perf_lines)):
+            cv.putText(frame, line, (8, frame.shape[0] - 10 - 18*i), cv.FONT_HERSHEY_SIMPLEX, 0.45, (0, 255, 255), thickness=1)
+
+        # if couldn't find a face, skip all this
+        if state.landmarks is None:
+            return frame
+
+        # get points as ints
+        nosePointInt = (int(state.nose_point[0]), int(state.nose_point[1]))
+        posePointInt = (int(state.pose_point[0]), int(state.pose_point[1]))
+        poseCenterInt = (int(state.pose_center[0]), int(state.pose_center[1]))
+
+        # draw facial landmarks on frame
+        self.drawLandmarks(frame, state.landmarks)
+
+        # draw mode-specific overlays
+        if state.control_mode == 'stick':
+            # draw gaze line from nose to pose point
+            cv.line(frame, nosePointInt, posePointInt, self.gaze_line_color, 2)
+            # draw deadzone
+            cv.circle(frame, poseCenterInt, state.deadzone_radius, self.deadzone_color, thickness=2)
+        elif state.control_mode == 'mouse':
+            # draw target position
+            cv.drawMarker(frame, posePointInt, self.marker_color, cv.MARKER_CROSS, 20, 2, cv.LINE_8)
+
+        # draw debug info
+        for i, line in enumerate(state.debug_lines):
+            cv.putText(frame, line, (20, 100 + 30*i), cv.FONT_HERSHEY_SIMPLEX, 0.75, (0, 0, 255), thickness=2)
+
+        return frame
+
+
+class previewRenderer():
+
+    def __init__(self, painter, window_name):
+        self.painter = painter
+        self.window_name = window_name
+        self.refresh_time = 1/face_aimer_settings['preview_rate']
+
+        # latest state handed over by the tracking loop. Its frame is copied into one of two buffers,
+        # the tracking loop reuses its own frame before the preview gets around to drawing it
+        self.state_lock = threading.Lock()
+        self.state = None
+        self.frame_buffers = [None, None]
+        self.pending_index = 0
+
+        # keys pressed in the preview window
+        self.key_queue = queue.Queue()
+
+        self.running = False
+        self.render_thread = None
+
+    def start(self):
+        self.running = True
+        self.render_thread = threading.Thread(target=self.renderLoop, daemon=True)
+        self.render_thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.render_thread is not None:
+            self.render_thread.join()
+
+    def update(self, state):
+        # replace the pending state, the tracking loop never waits on rendering
+        with self.state_lock:
+            buffer = self.frame_buffers[self.pending_index]
+            if buffer is None or buffer.shape != state.frame.shape:
+                buffer = self.frame_buffers[self.pending_index] = np.empty_like(state.frame)
+            np.copyto(buffer, state.frame)
+            landmarks = None if state.landmarks is None else state.landmarks.copy()
+            self.state = state._replace(frame=buffer, landmarks=landmarks)
+
+    def getKey(self):
+        try:
+            return self.key_queue.get(False)
+        except queue.Empty:
+            return -1
+
+    def renderLoop(self):
+        # the window belongs to this thread
+        cv.namedWindow(self.window_name, cv.WINDOW_NORMAL)
+        cv.setWindowProperty(self.window_name, cv.WND_PROP_TOPMOST, 1)
+
+        while self.running:
+            # get start time
+            tic = perf_counter()
+
+            # take the latest state, if there is a new one
+            with self.state_lock:
+                state = self.state
+                self.state = None
+                if state is not None:
+                    # updates go to the other buffer while this one is drawn
+                    self.pending_index ^= 1
+            if state is not None:
+                cv.imshow(self.window_name, self.painter.draw(state))
+                perf.since('render', tic)
+
+            # pump window events and pass keys back to the tracking loop
+            key = cv.waitKey(1)
+            if key != -1:
+                self.key_queue.put(key)
+
+            # get end time
+            toc = perf_counter()
+
+            # cap the preview rate
+            time_diff_s = toc-tic
+            if time_diff_s < self.refresh_time:
+                sleep(self.refresh_time - time_diff_s)
+
+        cv.destroyWindow(self.window_name)
+
+
+class hotkeyListener():
+
+    def __init__(self):
+        # global hotkeys stand in for the preview window's keys when running headless
+        from pynput import keyboard
+
+        hotkeys = face_aimer_settings['headless_hotkeys']
+        self.key_queue = queue.Queue()
+        # map each hotkey to the key code the preview window would have produced
+        self.listener = keyboard.GlobalHotKeys({
+            hotkeys['quit']: lambda: self.key_queue.put(27), # 'ESC'
+            hotkeys['switch_mode']: lambda: self.key_queue.put(9), # 'TAB'
+            hotkeys['pause']: lambda: self.key_queue.put(32), # 'SPACEBAR'
+            hotkeys['recalibrate']: lambda: self.key_queue.put(99), # 'C'
+        })
+
+    def start(self):
+        self.listener.start()
+
+    def stop(self):
+        self.listener.stop()
+
+    def getKey(self):
+        try:
+            return self.key_queue.get(False)
+        except queue.Empty:
+            return -1
@@ -0,0 +1,123 @@
+from time import perf_counter
+
+import numpy as np
+
+from settings import face_aimer_settings
+
+# quality levels, cheapest last: (name, detection scale factor, redetect interval factor, preview rate factor, flow frames)
+# factors are relative to the configured settings, a preview rate factor under 1 also caps the 'window' preview.
+# flow frames turns on landmark_flow with at least that many frames in a row propagated between predictor runs, None keeps the setting.
+# Every level solves the same landmarks the same way, poses don't move against the calibration when the level changes
+quality_levels = [
+    ('full', 1, 1, 1, None),
+    ('fewer detections', 1, 2, 1, None),
+    ('smaller detection', 0.75, 2, 1, None),
+    ('slower preview', 0.75, 2, 0.5, None),
+    ('fewer predictor runs', 0.5, 3, 0.5, 4),
+    ('minimum', 0.5, 4, 0.25, 8),
+]
+
+
+class qualityGovernor():
+    # holds the tracking loop's per-frame processing time under frame_budget_ms by trading quality for time.
+    # Steps down a level as soon as a window of frames averages over budget, back up once there's been headroom for a while
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+
+        # import settings
+        self.budget = face_aimer_settings['frame_budget_ms']/1000
+        self.window = face_aimer_settings['governor_window'] # frames averaged per decision
+        self.restore_ratio = 0.6 # average under this share of the budget counts as headroom
+        self.restore_windows = 4 # windows of headroom in a row before quality goes back up
+
+        # configured values the levels scale
+        self.base_scale = tracker.detection_scale
+        self.base_redetect = tracker.redetect_interval
+        self.base_preview_rate = face_aimer_settings['preview_rate']
+        self.base_flow = tracker.landmark_flow
+        self.base_flow_frames = tracker.flow_max_frames
+
+        self.frame_times = np.zeros(self.window)
+        self.frame_count = 0
+        self.headroom_windows = 0
+        self.level = 0
+        self.preview_time = None # min seconds between previews, None draws every frame
+        self.next_preview = 0
+
+        # governor statistics
+        self.level_changes = 0
+        self.level_time = [0]*len(quality_levels)
+        self.level_start = perf_counter()
+
+    def levelName(self):
+        return quality_levels[self.level][0]
+
+    def record(self, frame_time):
+        # called once a frame with its processing time (s), changes level at the end of each window
+        self.frame_times[self.frame_count] = frame_time
+        self.frame_count += 1
+        if self.frame_count < self.window:
+            return
+        self.frame_count = 0
+
+        mean_time = self.frame_times.mean()
+        # the face may have moved closer or further since the scale was set
+        self.tracker.detection_scale = self.detectionScale(quality_levels[self.level][1])
+        if mean_time > self.budget:
+            self.headroom_windows = 0
+            if self.level < len(quality_levels) - 1:
+                self.setLevel(self.level + 1)
+        elif mean_time < self.budget*self.restore_ratio:
+            self.headroom_windows += 1
+            if self.headroom_windows >= self.restore_windows and self.level > 0:
+                self.headroom_windows = 0
+                self.setLevel(self.level - 1)
+        else:
+            self.headroom_windows = 0
+
+    def setLevel(self, level):
+        now = perf_counter()
+        self.level_time[self.level] += now - self.level_start
+        self.level_start = now
+        self.level = level
+        self.level_changes += 1
+
+        (_, scale_factor, redetect_factor, preview_factor, flow_frames) = quality_levels[level]
+        self.tracker.detection_scale = self.detectionScale(scale_factor)
+        self.tracker.redetect_interval = int(self.base_redetect*redetect_factor)
+        self.preview_time = None if preview_factor >= 1 else 1/(self.base_preview_rate*preview_factor)
+        if flow_frames is None:
+            self.tracker.setLandmarkFlow(self.base_flow, self.base_flow_frames)
+        else:
+            self.tracker.setLandmarkFlow(True, max(self.base_flow_frames, flow_frames))
+
+    def detectionScale(self, scale_factor):
+        # don't shrink the frame so far the detector can't see the face anymore, sized from the last face tracked.
+        # With tracking_workers the workers detect at the configured scale, only the redetect interval applies to them
+        scale = self.base_scale*scale_factor
+        detector = getattr(self.tracker, 'detector', None)
+        if scale_factor < 1 and self.tracker.face_size and detector is not None:
+            box_size = self.tracker.face_size*self.tracker.box_scale
+            scale = max(scale, min(self.base_scale, 1.2*detector.min_face_size/box_size))
+        return scale
+
+    def previewDue(self):
+        # whether to draw the preview this frame, the preview rate is only capped at the lower levels
+        if self.preview_time is None:
+            return True
+        now = perf_counter()
+        if now < self.next_preview:
+            return False
+        self.next_preview = now + self.preview_time
+        return True
+
+    def governorStats(self):
+        self.level_time[self.level] += perf_counter() - self.level_start
+        self.level_start = perf_counter()
+        total = sum(self.level_time) or 1
+        stats = f"Quality governor ({self.budget*1000:.0f} ms budget): {self.level_changes} level changes, now '{self.levelName()}'"
+        for (level, level_time) in enumerate(self.level_time):
+            if level_time:
+                stats += f"\n  {quality_levels[level][0]}: {level_time/total:.1%} of the time"
+        return stats
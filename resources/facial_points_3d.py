@@ -74,4 +74,8 @@ model_points = np.array([
             (50,-165.0,-125.0),         # 65 - inner lips
             (0,-170.0,-125.0),          # 66 - inner lips
             (-50,-165.0,-125.0)         # 67 - inner lips
-        ], dtype=np.float64)
\ No newline at end of file
+        ], dtype=np.float64)
+
+# Landmarks that hold their shape as the face moves and talks (chin, nose, eye corners, mouth corners).
+# Solving the head pose on just these is cheaper than using all 68 points.
+stable_landmarks = [8, 27, 30, 31, 33, 35, 36, 39, 42, 45, 48, 54]
@@ -0,0 +1,45 @@
+import cv2 as cv
+import numpy as np
+
+
+class screenMapping():
+    # maps pose points to screen pixels through the perspective transform between the calibrated corners and the screen corners
+
+    def __init__(self, corners, res_x, res_y, homography=None):
+        # corners are pose points for the top left, top right, bottom right and bottom left of the screen
+        self.res_x = res_x
+        self.res_y = res_y
+        if homography is None:
+            screen_corners = np.float32([(0, 0), (res_x, 0), (res_x, res_y), (0, res_y)])
+            homography = cv.getPerspectiveTransform(np.float32(corners), screen_corners)
+        self.homography = np.asarray(homography, dtype=np.float64)
+
+        # plain floats, indexing numpy arrays one element at a time costs more than the math itself.
+        # a precomputed lookup grid was tried too, it was slower than this and took tens of MB
+        (self.h0, self.h1, self.h2, self.h3, self.h4, self.h5, self.h6, self.h7, self.h8) = self.homography.ravel().tolist()
+
+    def toScreen(self, pose_point):
+        # screen pixel for a pose point, clamped to the screen
+        (x, y) = pose_point
+        w = self.h6*x + self.h7*y + self.h8
+        if w < 1e-9:
+            # past the horizon of the calibrated plane, nowhere near the screen anyway
+            w = 1e-9
+        screen_x = int((self.h0*x + self.h1*y + self.h2)/w)
+        screen_y = int((self.h3*x + self.h4*y + self.h5)/w)
+
+        # adjust for overshoot
+        if screen_x < 0:
+            screen_x = 0
+        elif screen_x > self.res_x:
+            screen_x = self.res_x
+        if screen_y < 0:
+            screen_y = 0
+        elif screen_y > self.res_y:
+            screen_y = self.res_y
+        return (screen_x, screen_y)
+
+    def toPose(self, screen_point):
+        # pose point that maps to a screen pixel
+        point = cv.perspectiveTransform(np.float64([[screen_point]]), np.linalg.inv(self.homography))
+        return (float(point[0][0][0]), float(point[0][0][1]))
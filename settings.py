@@ -2,15 +2,70 @@
 
 face_aimer_settings = {
     'default_control_mode' : 'stick', # 'stick' or 'mouse'
+    'frame_source' : 0, # camera index, or a video file / folder of frames / .npy frame dump to replay
+    'camera_width' : None, # capture width to ask the camera for, None keeps the driver default
+    'camera_height' : None, # capture height to ask the camera for, None keeps the driver default
+    'camera_fps' : None, # capture frame rate to ask the camera for, None keeps the driver default
+    'camera_fourcc' : None, # capture pixel format, e.g. 'MJPG' (usually needed for high fps at high resolutions) or 'YUYV'. None keeps the driver default
+    'camera_buffer_size' : 1, # frames the driver queues up, 1 keeps latency lowest. None keeps the driver default
+    'camera_raw_yuyv' : False, # with camera_fourcc 'YUYV', skip color decoding and track on the camera's luma channel (needs a backend that supports it, e.g. V4L2)
+    'frame_source_realtime' : True, # replay recordings at their recorded frame rate
+    'calibration_file' : 'calibration.json', # calibration is saved here and reloaded on the next start if the camera, resolution & solver settings are the same. None to always calibrate
+    'calibration_samples' : 15, # calibration - frames averaged for each corner, poses far from the rest are left out
+    'camera_cache_file' : 'camera_cache.json', # camera intrinsics are cached here per camera & resolution so startup doesn't wait for a probe frame. None to always probe
+    'tracking_strategy' : 'roi', # 'roi' reuses the face box from the previous frame's landmarks, 'full' runs the face detector on every frame
+    'redetect_interval' : 30, # roi tracking - max frames between full face detections
+    'landmark_flow' : False, # roi tracking - carry landmarks between frames with optical flow, only running the landmark predictor when the flow stops holding up (not used with tracking_workers)
+    'flow_max_frames' : 4, # landmark flow - max frames in a row to propagate before running the predictor again
+    'flow_fb_error' : 1.0, # landmark flow - forward-backward error (px) of the worst landmark above which the predictor runs instead
+    'flow_reproject_error' : 6.0, # landmark flow - head pose reprojection error (px) above which propagated landmarks are refit by the predictor
+    'pnp_method' : 'iterative', # head pose solver - 'iterative', 'epnp' or 'sqpnp'
+    'pnp_warm_start' : True, # head pose solver - start from the previous frame's pose (iterative only)
+    'pnp_landmarks' : 'all', # head pose solver - 'all', 'stable' (chin, nose, eye & mouth corners) or a list of landmark indexes
+    'pnp_reset_error' : 12.0, # head pose solver - reprojection error (px) that resets the solver and re-detects the face
+    'pnp_compare' : False, # head pose solver - also time a full solve every frame and report the difference on exit
+    'threaded_capture' : True, # read the camera on its own thread and always track the newest frame
+    'tracking_workers' : 0, # number of processes running face detection & landmarks in parallel, 0 tracks on the main thread
+    'face_detector' : 'hog', # 'hog' (dlib), 'cascade' (OpenCV Haar/LBP cascade, cheapest) or 'yunet' (OpenCV DNN, needs yunet_model). Use tools/detector_benchmark.py to compare them
+    'hog_upsample' : 0, # hog detector - times the frame is upsampled before detecting, finds smaller faces but each one roughly quadruples the cost
+    'cascade_file' : 'haarcascade_frontalface_default.xml', # cascade detector - one of the cascades bundled with opencv-python, or the path to any Haar/LBP cascade file (e.g. lbpcascade_frontalface_improved.xml)
+    'cascade_min_face' : 0.15, # cascade detector - smallest face to look for, as a fraction of the frame height. Lower finds faces further away but is much slower
+    'yunet_model' : 'resources/face_detection_yunet_2023mar.onnx', # yunet detector - model file from the OpenCV model zoo
+    'yunet_score_threshold' : 0.8, # yunet detector - confidence needed to count as a face
+    'detection_scale' : 1.0, # downscale factor for face detection (e.g. 0.5), landmarks are still fit at full resolution. Use tools/detection_scale_sweep.py to pick one
+    'frame_budget_ms' : None, # quality governor - per-frame processing time (ms) to hold. Detection, preview & landmark fitting get cheaper while frames take longer, and are restored when there's headroom. None disables it
+    'governor_window' : 15, # quality governor - frames averaged for each decision
+    'preview_mode' : 'window', # 'window' draws the preview every frame, 'threaded' draws it on its own thread at preview_rate, 'headless' shows no preview
+    'preview_rate' : 15, # threaded preview - max preview refresh rate in Hz
+    'headless_hotkeys' : {'quit' : '<ctrl>+<alt>+q', 'switch_mode' : '<ctrl>+<alt>+m', 'pause' : '<ctrl>+<alt>+p', 'recalibrate' : '<ctrl>+<alt>+c'}, # headless - global hotkeys that replace ESC, TAB, SPACEBAR and C
     'res_x' : 2560, # horizontal resolution
     'res_y' : 1440, # vertical resolution
     'controller_deadzone_threshold' : 0.30, # stick controls - deadzone as a % radius from the center of total facial pose space
     'stick_refresh_rate' : 250, # refresh rate for stick controls in Hz
     'mouse_refresh_rate' : 250, # refresh rate for mouse controls in Hz
+    'scheduler_spin_ms' : 1.0, # controller timing - spin for the last ms before each tick for precise timing, 0 to only sleep (less CPU, more jitter)
     'turn_speed_h' : 35, # stick controls - horizontal turn speed
     'turn_speed_v' : 30, # stick controls - vertical turn speed
     'move_speed' : 80, # mouse controls - mouse movement speed
     'move_smoothing' : 4, # mouse controls - how many camera frames to buffer (increases smoothness, adds latency)
+    'pose_filter' : 'none', # 'none' (mouse uses move_smoothing, stick uses raw poses), 'moving_average', 'one_euro' or 'kalman'. Compare them with tools/evaluate_pose_filters.py
+    'filter_max_extrapolation' : 0.1, # one_euro & kalman - max seconds to extrapolate a pose forward between camera frames
+    'one_euro_min_cutoff' : 1.0, # one_euro - cutoff frequency (Hz) when the head is still, lower is smoother
+    'one_euro_beta' : 0.01, # one_euro - how quickly smoothing drops off with head speed, higher is more responsive
+    'one_euro_d_cutoff' : 1.0, # one_euro - cutoff frequency (Hz) for the velocity estimate
+    'kalman_process_noise' : 20000, # kalman - how freely the head can accelerate, higher is more responsive
+    'kalman_measurement_noise' : 4, # kalman - variance of the tracked pose (px^2), higher is smoother
+    'output_backend' : 'auto', # mouse output - 'win32', 'uinput' (linux, needs /dev/uinput access), 'x11' or 'auto'
+    'output_min_step' : 1, # mouse output - smallest move (px) sent to the OS, smaller moves are merged into the next one
+    'pose_broadcast_port' : None, # send every pose to other programs over UDP on this port (e.g. 47800), the packet format is in pose_broadcast.py. None turns it off
+    'pose_broadcast_host' : '127.0.0.1', # pose broadcast - address the UDP packets go to
+    'pose_broadcast_shm' : None, # pose broadcast - also keep the newest pose in a shared memory slot with this name (e.g. 'face_aimer_pose'). None turns it off
+    'flight_recorder_file' : 'flight_recorder.bin', # every tracked frame & mouse move is kept in this fixed-size file, for looking into glitches with tools/dump_flight_recorder.py. None turns it off
+    'flight_recorder_frames' : 65536, # flight recorder - tracked frames kept (about 36 minutes at 30 fps, 5.8 MB)
+    'flight_recorder_moves' : 262144, # flight recorder - mouse moves kept (about 17 minutes at 250 Hz, 8.4 MB)
+    'perf_window' : 512, # performance stats - recent samples per stage the percentiles are taken over
+    'perf_export_file' : None, # performance stats - file to append per-stage timings to every perf_export_interval, .csv for csv rows, anything else for json lines. None to not export
+    'perf_export_interval' : 10, # performance stats - seconds between exports
     'marker_color_bgr' : (255,255,0), # mouse controls - color of the crosshair
     'gaze_line_color_bgr' : (255, 255, 0), # stick controls - color of the stick mode line coming out of your nose
     'deadzone_color_bgr' : (0, 255, 0), # stick controls - color of the deadzone circle
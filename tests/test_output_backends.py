@@ -0,0 +1,87 @@
+# outputBackend's sub-pixel remainders and coalescing, through the recorder backend so nothing reaches the OS
+# run from the install folder: python -m pytest tests
+
+import pytest
+
+from output_backends import recorderBackend
+
+
+def makeOutput(min_step=1):
+    # min_step set here rather than taken from settings
+    output = recorderBackend()
+    output.min_step = min_step
+    return output
+
+
+def sentMoves(output):
+    return [(dx, dy) for (_, dx, dy) in output.moves]
+
+
+def testWholeMovesSentAsIs():
+    output = makeOutput()
+    output.move(3, -2)
+    assert sentMoves(output) == [(3, -2)]
+    assert (output.remainder_x, output.remainder_y) == (0, 0)
+
+
+def testRemainderCarriesOver():
+    # 0.6 + 0.6 + 0.6 = 1.8, one pixel goes out on the second move and 0.8 is left
+    output = makeOutput()
+    for _ in range(3):
+        output.move(0.6, 0)
+    assert sentMoves(output) == [(1, 0)]
+    assert output.remainder_x == pytest.approx(0.8)
+    assert output.cursor == (1, 0)
+
+
+def testNegativeRemainder():
+    # int() truncates towards zero, so negative moves carry the same way as positive ones
+    output = makeOutput()
+    output.move(-1.5, 0)
+    output.move(-0.75, 0)
+    assert sentMoves(output) == [(-1, 0), (-1, 0)]
+    assert output.remainder_x == pytest.approx(-0.25)
+
+
+def testNothingLostOverManyMoves():
+    # whatever's sent plus what's still held back adds up to everything asked for
+    output = makeOutput()
+    for _ in range(1000):
+        output.move(0.37, -0.21)
+    assert output.cursor[0] + output.remainder_x == pytest.approx(370)
+    assert output.cursor[1] + output.remainder_y == pytest.approx(-210)
+
+
+def testSmallMovesCoalesced():
+    # moves under min_step are held back and merged into the next one that's big enough
+    output = makeOutput(min_step=3)
+    output.move(1, 1)
+    output.move(1, 0.5)
+    assert sentMoves(output) == []
+    assert output.coalesced_count == 2
+    output.move(1.5, 0)
+    assert sentMoves(output) == [(3, 1)]
+    assert (output.remainder_x, output.remainder_y) == pytest.approx((0.5, 0.5))
+    assert output.sent_count == 1
+
+
+def testOneAxisOverMinStepSendsBoth():
+    output = makeOutput(min_step=2)
+    output.move(2, 1)
+    assert sentMoves(output) == [(2, 1)]
+
+
+def testResetDropsHeldBackMovement():
+    output = makeOutput()
+    output.move(0.9, 0.9)
+    output.reset()
+    output.move(0.9, 0.9)
+    assert sentMoves(output) == []
+
+
+def testStats():
+    output = makeOutput()
+    assert output.outputStats() == "Output: no moves"
+    output.move(0.5, 0)
+    output.move(0.5, 0)
+    assert output.outputStats() == "Output (recorderBackend): 1 moves sent, 1 of 2 merged (50.0%)"
@@ -0,0 +1,103 @@
+import sys
+from time import perf_counter, sleep
+
+from settings import face_aimer_settings
+
+
+class tickScheduler():
+
+    def __init__(self, rate):
+        self.period = 1/rate
+
+        # sleep until this close to the deadline, then spin the rest of the way
+        self.spin_time = face_aimer_settings['scheduler_spin_ms']/1000
+
+        # windows sleeps in ~15ms steps unless the timer resolution is raised
+        self.timer_resolution = None
+        if sys.platform == 'win32':
+            import ctypes
+            self.timer_resolution = ctypes.windll.winmm
+
+        self.next_deadline = 0
+        self.resetStats()
+
+    def resetStats(self):
+        self.start_time = perf_counter()
+        self.tick_count = 0
+        self.missed_count = 0
+        self.lateness_total = 0
+        self.lateness_max = 0
+        self.idle_time = 0
+        self.idle_start = None
+
+    def start(self):
+        if self.timer_resolution is not None:
+            self.timer_resolution.timeBeginPeriod(1)
+        self.resetStats()
+        self.next_deadline = perf_counter()
+
+    def stop(self):
+        if self.timer_resolution is not None:
+            self.timer_resolution.timeEndPeriod(1)
+
+    def pause(self):
+        # stop ticking while there's nothing to do, the timer resolution goes back to normal too
+        self.stop()
+        self.idle_start = perf_counter()
+
+    def resume(self):
+        # start a new tick grid from now, the paused time doesn't count as missed ticks
+        if self.timer_resolution is not None:
+            self.timer_resolution.timeBeginPeriod(1)
+        now = perf_counter()
+        if self.idle_start is not None:
+            self.idle_time += now - self.idle_start
+            self.idle_start = None
+        self.next_deadline = now
+
+    def wait(self):
+        # wait for the next tick's deadline, returns the time the tick started
+        deadline = self.next_deadline
+        now = perf_counter()
+
+        if now - deadline >= self.period:
+            # fell a whole tick or more behind, skip the missed ticks rather than bursting through them
+            missed = int((now - deadline)/self.period)
+            self.missed_count += missed
+            deadline += missed*self.period
+        else:
+            # sleep most of the way, then spin for precision, yielding so other threads still run
+            if deadline - now > self.spin_time:
+                sleep(deadline - now - self.spin_time)
+            while perf_counter() < deadline:
+                sleep(0)
+            now = perf_counter()
+
+        # deadlines stay on a fixed grid, so lateness doesn't add up
+        self.next_deadline = deadline + self.period
+
+        # update statistics
+        lateness = now - deadline
+        self.tick_count += 1
+        self.lateness_total += lateness
+        self.lateness_max = max(self.lateness_max, lateness)
+
+        return now
+
+    def idleTime(self):
+        idle_time = self.idle_time
+        if self.idle_start is not None:
+            idle_time += perf_counter() - self.idle_start
+        return idle_time
+
+    def achievedRate(self):
+        # while ticking, paused time is left out
+        elapsed = perf_counter() - self.start_time - self.idleTime()
+        return self.tick_count/elapsed if elapsed > 0 else 0
+
+    def schedulerStats(self):
+        if not self.tick_count:
+            return "Scheduler: no ticks"
+        return (f"Scheduler: {self.achievedRate():.1f} Hz of {1/self.period:.0f} Hz, "
+                f"jitter mean {self.lateness_total/self.tick_count*1000:.3f} ms, max {self.lateness_max*1000:.3f} ms, "
+                f"{self.missed_count} missed ticks, idle {self.idleTime()/(perf_counter() - self.start_time):.1%} of the time")
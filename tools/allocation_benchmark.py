@@ -0,0 +1,75 @@
+# memory benchmark: replay a recording through readFrame and trackFace under tracemalloc, reporting steady-state allocations per frame
+# usage: python -m tools.allocation_benchmark <clip, frame folder or .npy> [--frames 200] [--threaded]
+
+import argparse
+import tracemalloc
+
+import numpy as np
+
+from settings import face_aimer_settings
+
+from face_aimer import faceAimer
+
+
+def allocationBenchmark(source, max_frames, warmup_frames, threaded, preview):
+    # the capture thread would race through the recording if it wasn't paced
+    face_aimer_settings['frame_source_realtime'] = threaded
+    face_aimer_settings['threaded_capture'] = threaded
+    aimer = faceAimer(frame_source=source, preview_mode='headless')
+
+    def frameStep():
+        # same path as faceAimer.run, minus the window
+        frame = aimer.readFrame()
+        (nosePoint, posePoint) = aimer.trackFace(frame)
+        if preview:
+            aimer.painter.displayFrame(frame)
+        return posePoint
+
+    # let buffers, caches and the roi settle before measuring
+    for _ in range(warmup_frames):
+        frameStep()
+
+    tracemalloc.start(10)
+    start_snapshot = tracemalloc.take_snapshot()
+    (start_size, _) = tracemalloc.get_traced_memory()
+
+    # peak memory above the frame's starting point is what the frame allocated on the way
+    frame_peaks = []
+    for _ in range(max_frames):
+        (current, _) = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        frameStep()
+        (_, peak) = tracemalloc.get_traced_memory()
+        frame_peaks.append(peak - current)
+
+    (end_size, _) = tracemalloc.get_traced_memory()
+    end_snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    # report
+    frame_peaks_kb = np.array(frame_peaks)/1024
+    (p50, p95) = np.percentile(frame_peaks_kb, [50, 95])
+    print(f"{max_frames} frames ({warmup_frames} warmup skipped), threaded capture {'on' if threaded else 'off'}, "
+          f"preview conversion {'on' if preview else 'off'}")
+    print(f"Allocated per frame KB: p50 {p50:.1f}, p95 {p95:.1f}, max {frame_peaks_kb.max():.1f}")
+    print(f"Retained growth: {(end_size - start_size)/max_frames:.0f} bytes/frame")
+    print("Largest allocation sites still alive:")
+    snapshot_filter = (tracemalloc.Filter(False, tracemalloc.__file__),)
+    for stat in end_snapshot.filter_traces(snapshot_filter).compare_to(start_snapshot.filter_traces(snapshot_filter), 'lineno')[:5]:
+        print(f"  {stat}")
+
+    if aimer.grabber is not None:
+        aimer.grabber.stop()
+    aimer.cap.release()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure memory allocated per frame by the tracking loop on a recording.")
+    parser.add_argument('source', help="video file, folder of frames or .npy frame dump")
+    parser.add_argument('--frames', type=int, default=200, help="frames to measure")
+    parser.add_argument('--warmup', type=int, default=20, help="frames to run before measuring")
+    parser.add_argument('--threaded', action='store_true', help="read frames on the capture thread")
+    parser.add_argument('--preview', action='store_true', help="also convert & mirror each frame for the preview")
+    args = parser.parse_args()
+
+    allocationBenchmark(args.source, args.frames, args.warmup, args.threaded, args.preview)
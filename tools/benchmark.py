@@ -0,0 +1,109 @@
+# end-to-end benchmark: replay a recording through trackFace and the controller, with mouse output recorded in memory
+# usage: python -m tools.benchmark <clip, frame folder or .npy> [--calibration calibration.json] [--mode stick]
+
+import argparse
+from time import perf_counter
+
+import numpy as np
+
+from settings import face_aimer_settings
+
+# replay as fast as possible, on the benchmark thread
+face_aimer_settings['frame_source_realtime'] = False
+face_aimer_settings['threaded_capture'] = False
+
+from face_aimer import faceAimer
+from input_controllers import mouseController, stickController
+from output_backends import recorderBackend
+from perf_stats import perf
+from pose_channel import poseChannel
+
+
+def benchmark(source, calibration_file, mode, max_frames, warmup_frames, fps, workers):
+    face_aimer_settings['tracking_workers'] = workers
+    aimer = faceAimer(frame_source=source, preview_mode='headless')
+
+    if calibration_file and not aimer.loadCalibration(calibration_file):
+        print(f"{calibration_file} was made with a different camera, resolution or solver settings, not using it")
+        calibration_file = None
+    if not calibration_file:
+        # no calibration, use the whole frame as pose space
+        width = aimer.camera_matrix[0][2]*2
+        height = aimer.camera_matrix[1][2]*2
+        aimer.setCalibration([(0, 0), (width, 0), (width, height), (0, height)])
+
+    # controller with its output discarded
+    channel = poseChannel()
+    pose_dimensions = (aimer.pose_width, aimer.pose_height, aimer.pose_center)
+    output = recorderBackend()
+    if mode == 'mouse':
+        controller = mouseController(channel, pose_dimensions, aimer.screen_mapping, output)
+    else:
+        controller = stickController(channel, pose_dimensions, aimer.controller_deadzone_radius, output)
+    # controller ticks per camera frame
+    ticks_per_frame = max(1, round(1/(controller.refresh_time*fps)))
+
+    # latency is from reading a frame to its pose reaching the controller
+    frame_times = []
+    hits = 0
+    frame_count = 0
+    while frame_count < max_frames + warmup_frames:
+        tic = perf_counter()
+        if frame_count == warmup_frames:
+            start_time = tic
+
+        # same path as faceAimer.run, minus the preview
+        ok, frame = aimer.cap.read()
+        if not ok:
+            break
+        aimer.frame_time = tic
+        if aimer.pool is None:
+            tracked = aimer.trackFace(frame) + (tic,)
+        else:
+            tracked = aimer.trackFacePooled(frame, block=True)
+        if tracked is not None:
+            channel.put(tracked[1], tracked[2])
+        for _ in range(ticks_per_frame):
+            controller.tick(perf_counter())
+
+        toc = perf_counter()
+        frame_count += 1
+        if frame_count > warmup_frames and tracked is not None:
+            frame_times.append(toc - tracked[2])
+            if tracked[1][0] != -1:
+                hits += 1
+    elapsed = perf_counter() - start_time if frame_count > warmup_frames else 0
+    aimer.cap.release()
+
+    if not frame_times:
+        print(f"Not enough frames in {source}")
+        exit(1)
+
+    # report
+    frame_times_ms = np.array(frame_times)*1000
+    (p50, p95, p99) = np.percentile(frame_times_ms, [50, 95, 99])
+    print(f"{len(frame_times)} frames tracked ({warmup_frames} warmup skipped), {mode} controller at {ticks_per_frame} ticks/frame")
+    print(f"FPS: {len(frame_times)/elapsed:.1f}")
+    print(f"Frame latency ms: p50 {p50:.2f}, p95 {p95:.2f}, p99 {p99:.2f}, max {frame_times_ms.max():.2f}")
+    print(f"Face hit rate: {hits/len(frame_times):.1%}")
+    print(output.outputStats())
+    print(aimer.tracker.trackingStats())
+    print(aimer.solver.solverStats())
+    print(perf.perfStats())
+    if aimer.pool is not None:
+        print(aimer.pool.poolStats())
+        aimer.pool.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the full tracking to controller path on a recording.")
+    parser.add_argument('source', help="video file, folder of frames or .npy frame dump")
+    parser.add_argument('--calibration', help="calibration file, defaults to the whole frame as pose space")
+    parser.add_argument('--mode', choices=['mouse', 'stick'], default='stick')
+    parser.add_argument('--frames', type=int, default=1000, help="max frames to measure")
+    parser.add_argument('--warmup', type=int, default=10, help="frames to run before measuring")
+    parser.add_argument('--fps', type=float, default=30, help="camera rate the controller ticks are spread over")
+    parser.add_argument('--workers', type=int, default=0, help="tracking worker processes, 0 tracks on the main thread")
+    args = parser.parse_args()
+
+    benchmark(args.source, args.calibration, args.mode, args.frames, args.warmup, args.fps, args.workers)
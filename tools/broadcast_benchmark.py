@@ -0,0 +1,77 @@
+# loopback latency of the pose broadcast: a publisher process sends poses, this process receives them over udp and shared memory
+# usage: python -m tools.broadcast_benchmark [--count 2000] [--rate 250] [--poll 0.0005]
+
+import argparse
+import multiprocessing
+from time import perf_counter, process_time, sleep
+
+import numpy as np
+
+from pose_broadcast import posePublisher, shmPoseSubscriber, udpPoseSubscriber
+
+
+def publishPoses(port, shm_name, count, rate, ready, go):
+    publisher = posePublisher(port, shm_name, '127.0.0.1')
+    ready.set()
+    go.wait()
+    rot_vect = np.zeros((3, 1))
+    trans_vect = np.array([[0.0], [0.0], [600.0]])
+    for i in range(count):
+        publisher.publish(perf_counter(), (float(i), float(i)), rot_vect, trans_vect, True)
+        sleep(1/rate)
+    print(f"  {publisher.publisherStats()}")
+    publisher.close()
+
+
+def benchmarkTransport(transport, port, shm_name, count, rate, poll_interval):
+    ready = multiprocessing.Event()
+    go = multiprocessing.Event()
+    publisher = multiprocessing.Process(target=publishPoses, args=(port if transport == 'udp' else 0, shm_name if transport == 'shm' else '',
+                                                                  count, rate, ready, go))
+    publisher.start()
+    ready.wait()
+    if transport == 'udp':
+        subscriber = udpPoseSubscriber(port, '127.0.0.1')
+    else:
+        subscriber = shmPoseSubscriber(shm_name, poll_interval)
+    go.set()
+
+    # publish to receive, both on the machine's perf_counter clock
+    latencies = []
+    last_seq = 0
+    skipped = 0
+    wall = perf_counter()
+    cpu = process_time()
+    while True:
+        sample = subscriber.receive(timeout=1.0)
+        if sample is None:
+            break
+        latencies.append(perf_counter() - sample.publish_time)
+        skipped += sample.seq - last_seq - 1
+        last_seq = sample.seq
+        if sample.seq == count:
+            break
+    cpu_share = (process_time() - cpu)/(perf_counter() - wall)
+    publisher.join()
+    subscriber.close()
+
+    if not latencies:
+        print(f"{transport}: nothing received")
+        return
+    latencies_us = np.array(latencies)*1e6
+    (p50, p95, p99) = np.percentile(latencies_us, [50, 95, 99])
+    print(f"{transport}: {len(latencies)}/{count} received, {skipped} skipped, latency us p50 {p50:.0f}, p95 {p95:.0f}, "
+          f"p99 {p99:.0f}, max {latencies_us.max():.0f}, subscriber cpu {cpu_share:.1%}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure pose broadcast latency over loopback udp and shared memory.")
+    parser.add_argument('--count', type=int, default=2000, help="poses to publish per transport")
+    parser.add_argument('--rate', type=float, default=250, help="poses per second")
+    parser.add_argument('--port', type=int, default=47801)
+    parser.add_argument('--shm', default='face_aimer_pose_benchmark')
+    parser.add_argument('--poll', type=float, default=0.0005, help="shared memory subscriber poll interval (s), 0 spins")
+    args = parser.parse_args()
+
+    for transport in ('udp', 'shm'):
+        benchmarkTransport(transport, args.port, args.shm, args.count, args.rate, args.poll)
@@ -0,0 +1,56 @@
+# sweep face detection scales over a recorded clip, printing detection time and face hit rate per scale
+# usage: python -m tools.detection_scale_sweep <clip> [--scales 1 0.75 0.5 0.25]
+
+import argparse
+from time import perf_counter
+
+import cv2 as cv
+import numpy as np
+
+from face_tracker import faceTracker
+
+
+def loadFrames(clip_path, max_frames):
+    # read the clip into grayscale frames
+    cap = cv.VideoCapture(clip_path)
+    frames = []
+    while len(frames) < max_frames:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frames.append(cv.cvtColor(frame, cv.COLOR_BGR2GRAY))
+    cap.release()
+    return frames
+
+
+def sweep(frames, scales):
+    tracker = faceTracker()
+    print(f"{len(frames)} frames at {frames[0].shape[1]}x{frames[0].shape[0]}")
+    print(f"{'scale':>6} {'mean ms':>8} {'p95 ms':>8} {'hit rate':>9}")
+
+    for scale in scales:
+        tracker.detection_scale = scale
+        times = []
+        hits = 0
+        for gray in frames:
+            tic = perf_counter()
+            face_box = tracker.detectFace(gray)
+            times.append(perf_counter() - tic)
+            if face_box is not None:
+                hits += 1
+        times_ms = np.array(times)*1000
+        print(f"{scale:>6.2f} {times_ms.mean():>8.2f} {np.percentile(times_ms, 95):>8.2f} {hits/len(frames):>9.1%}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare face detection time and hit rate across detection scales.")
+    parser.add_argument('clip', help="recorded video clip")
+    parser.add_argument('--scales', type=float, nargs='+', default=[1.0, 0.75, 0.5, 0.25])
+    parser.add_argument('--max-frames', type=int, default=600)
+    args = parser.parse_args()
+
+    frames = loadFrames(args.clip, args.max_frames)
+    if not frames:
+        print(f"Couldn't read any frames from {args.clip}")
+        exit(1)
+    sweep(frames, args.scales)
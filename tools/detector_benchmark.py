@@ -0,0 +1,90 @@
+# compare the face detector backends on recorded clips: detection time, miss rate and how well each one's boxes work for the landmarks
+# usage: python -m tools.detector_benchmark <clip> [<clip> ...] [--cascades haarcascade_frontalface_alt2.xml lbpcascade_frontalface_improved.xml]
+# every frame is expected to have a face in it, so frames without a detection count as misses
+
+import argparse
+from time import perf_counter
+
+import numpy as np
+
+from face_detectors import cascadeDetector, hogDetector, yunetDetector
+from face_tracker import faceTracker
+from settings import face_aimer_settings
+from tools.detection_scale_sweep import loadFrames
+
+
+def detectorOptions(cascades, yunet_model):
+    # (label, function building the detector) for every backend to try
+    options = [('hog', lambda: hogDetector(upsample=0)),
+               ('hog upsample 1', lambda: hogDetector(upsample=1))]
+    for cascade_file in cascades:
+        options.append((cascade_file, lambda cascade_file=cascade_file: cascadeDetector(cascade_file)))
+    options.append(('yunet', lambda: yunetDetector(yunet_model)))
+    return options
+
+
+def boxOverlap(box, other):
+    # intersection over union of two dlib rectangles
+    intersection = box.intersect(other)
+    if intersection.is_empty():
+        return 0
+    return intersection.area()/(box.area() + other.area() - intersection.area())
+
+
+def benchmarkDetectors(frames, options, scale):
+    # the first option is the reference the others' boxes and landmarks are compared against
+    tracker = faceTracker()
+    tracker.detection_scale = scale
+    print(f"{len(frames)} frames at {frames[0].shape[1]}x{frames[0].shape[0]}, detection scale {scale}")
+    print(f"{'detector':>40} {'mean ms':>8} {'p95 ms':>8} {'miss rate':>10} {'box agree':>10} {'landmark diff px':>17}")
+
+    reference = None
+    for (label, makeDetector) in options:
+        try:
+            tracker.detector = makeDetector()
+        except (IOError, AttributeError) as error:
+            print(f"{label:>40}  skipped: {error}")
+            continue
+
+        times = []
+        boxes = []
+        for gray in frames:
+            tic = perf_counter()
+            boxes.append(tracker.detectFace(gray))
+            times.append(perf_counter() - tic)
+        times_ms = np.array(times)*1000
+        found = [box is not None for box in boxes]
+
+        # landmarks fit in each box, the predictor was trained on hog boxes so other framings can throw it off
+        landmarks = [None if box is None else tracker.predictLandmarks(gray, box).copy() for (gray, box) in zip(frames, boxes)]
+        if reference is None:
+            reference = (boxes, landmarks)
+        both = [i for i in range(len(frames)) if boxes[i] is not None and reference[0][i] is not None]
+        if both:
+            agree = np.mean([boxOverlap(boxes[i], reference[0][i]) >= 0.5 for i in both])
+            landmark_diff = np.mean([np.linalg.norm(landmarks[i] - reference[1][i], axis=1).mean() for i in both])
+            comparison = f"{agree:>10.1%} {landmark_diff:>17.2f}"
+        else:
+            comparison = f"{'-':>10} {'-':>17}"
+
+        print(f"{label:>40} {times_ms.mean():>8.2f} {np.percentile(times_ms, 95):>8.2f} {1 - np.mean(found):>10.1%} {comparison}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare face detector backends on recorded clips.")
+    parser.add_argument('clips', nargs='+', help="recorded video clips")
+    parser.add_argument('--cascades', nargs='+', default=['haarcascade_frontalface_default.xml', 'haarcascade_frontalface_alt2.xml'],
+                        help="cascade files to try, bundled names or paths")
+    parser.add_argument('--yunet-model', default=face_aimer_settings['yunet_model'])
+    parser.add_argument('--scale', type=float, default=face_aimer_settings['detection_scale'], help="detection scale")
+    parser.add_argument('--max-frames', type=int, default=600, help="max frames per clip")
+    args = parser.parse_args()
+
+    options = detectorOptions(args.cascades, args.yunet_model)
+    for clip in args.clips:
+        frames = loadFrames(clip, args.max_frames)
+        if not frames:
+            print(f"Couldn't read any frames from {clip}")
+            continue
+        print(f"\n{clip}")
+        benchmarkDetectors(frames, options, args.scale)
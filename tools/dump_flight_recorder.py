@@ -0,0 +1,56 @@
+# convert a flight recorder file to numpy arrays and point out the biggest jumps
+# usage: python -m tools.dump_flight_recorder [flight_recorder.bin] [--output snapshot.npz] [--last 60]
+# the snapshot's 'timestamps' & 'pose_points' load straight into tools.evaluate_pose_filters --poses
+
+import argparse
+from datetime import datetime
+
+import numpy as np
+
+from flight_recorder import readFlightRecord
+from settings import face_aimer_settings
+
+
+def clockTime(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime('%H:%M:%S.%f')[:-3]
+
+
+def dumpFlightRecord(path, output, last_seconds=None):
+    (frames, moves) = readFlightRecord(path)
+    if last_seconds is not None:
+        # only the end of the recording, up to the newest record
+        end = max(frames['time'].max(initial=0), moves['time'].max(initial=0))
+        frames = frames[frames['time'] >= end - last_seconds]
+        moves = moves[moves['time'] >= end - last_seconds]
+
+    if len(frames):
+        print(f"{len(frames)} frames from {clockTime(frames['time'][0])} to {clockTime(frames['time'][-1])}, "
+              f"face found in {frames['found'].mean():.1%}")
+        # the biggest jump between two frames that both had a face
+        both = frames['found'][1:] & frames['found'][:-1]
+        jumps = np.where(both, np.linalg.norm(np.diff(frames['pose_point'], axis=0), axis=1), 0)
+        if jumps.any():
+            i = jumps.argmax() + 1
+            print(f"Biggest pose jump: {jumps.max():.1f} px at {clockTime(frames['time'][i])} (frame {i})")
+    if len(moves):
+        sent = np.abs(moves['sent_x']) + np.abs(moves['sent_y'])
+        i = sent.argmax()
+        print(f"{len(moves)} moves from {clockTime(moves['time'][0])} to {clockTime(moves['time'][-1])}, "
+              f"biggest sent ({moves['sent_x'][i]}, {moves['sent_y'][i]}) px at {clockTime(moves['time'][i])} (move {i})")
+
+    if output:
+        np.savez_compressed(output, timestamps=frames['time'], pose_points=frames['pose_point'], nose_points=frames['nose_point'],
+                            rvecs=frames['rvec'], tvecs=frames['tvec'], found=frames['found'],
+                            move_times=moves['time'], move_requested=np.stack([moves['dx'], moves['dy']], axis=1),
+                            move_sent=np.stack([moves['sent_x'], moves['sent_y']], axis=1))
+        print(f"Saved to {output}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert a flight recorder file to numpy arrays.")
+    parser.add_argument('path', nargs='?', default=face_aimer_settings['flight_recorder_file'], help="flight recorder file")
+    parser.add_argument('--output', help=".npz file to save the arrays to")
+    parser.add_argument('--last', type=float, help="only the last this many seconds")
+    args = parser.parse_args()
+
+    dumpFlightRecord(args.path, args.output, args.last)
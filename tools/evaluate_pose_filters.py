@@ -0,0 +1,102 @@
+# compare pose filters offline: camera-rate poses in, controller-rate targets out, measuring lag and jitter
+# usage: python -m tools.evaluate_pose_filters [--poses recording.npz]
+
+import argparse
+
+import numpy as np
+
+from pose_filters import makePoseFilter
+from settings import face_aimer_settings
+
+
+def syntheticTruth(t):
+    # head motion in pose space: a slow sweep, a hold, then quick flicks
+    x = np.where(t < 5, 300*np.sin(2*np.pi*0.3*t), 0.0)
+    y = np.where(t < 5, 150*np.sin(2*np.pi*0.2*t), 0.0)
+    flick_t = np.clip(t - 8, 0, None)
+    phase = np.clip((flick_t % 1.0)/0.15, 0, 1)
+    step = phase*phase*(3 - 2*phase) # smoothstep over 0.15s
+    direction = np.where((flick_t // 1.0) % 2 == 0, 1, -1)
+    x = np.where(t >= 8, direction*(-200 + 400*step), x)
+    return np.stack([x, y], axis=1)
+
+
+def syntheticPoses(duration, fps, noise, seed):
+    rng = np.random.default_rng(seed)
+    timestamps = np.arange(0, duration, 1/fps)
+    points = syntheticTruth(timestamps) + rng.normal(0, noise, (len(timestamps), 2))
+    return timestamps, points
+
+
+def simulate(pose_filter, timestamps, points, tick_rate, processing_latency):
+    # run the filter like a controller would, a pose becomes usable processing_latency after capture
+    tick_times = np.arange(timestamps[0] + processing_latency, timestamps[-1], 1/tick_rate)
+    outputs = np.full((len(tick_times), 2), np.nan)
+    next_pose = 0
+    for i, tick_time in enumerate(tick_times):
+        while next_pose < len(timestamps) and timestamps[next_pose] + processing_latency <= tick_time:
+            pose_filter.update(tuple(points[next_pose]), timestamps[next_pose])
+            next_pose += 1
+        target = pose_filter.predict(tick_time)
+        if target is not None:
+            outputs[i] = target
+    return tick_times, outputs
+
+
+def lagAndJitter(tick_times, outputs, truth, tick_rate):
+    # lag is the delay that best lines the output up with the truth,
+    # jitter is how much the output shakes around its own 200ms average while the head is still
+    valid = ~np.isnan(outputs[:, 0])
+    tick_times = tick_times[valid]
+    outputs = outputs[valid]
+    rms_error = np.sqrt(np.mean(np.sum((outputs - truth(tick_times))**2, axis=1)))
+
+    best_lag = 0
+    best_rms = np.inf
+    for lag in np.arange(-0.1, 0.5, 0.001):
+        rms = np.sqrt(np.mean(np.sum((outputs - truth(tick_times - lag))**2, axis=1)))
+        if rms < best_rms:
+            best_lag = lag
+            best_rms = rms
+
+    window = int(0.2*tick_rate) | 1
+    kernel = np.ones(window)/window
+    shake = np.stack([outputs[window//2:-(window//2), axis] - np.convolve(outputs[:, axis], kernel, mode='valid') for axis in range(2)], axis=1)
+    shake_times = tick_times[window//2:-(window//2)]
+    # still means the head hasn't moved for the last half second (covering filter lag) and won't for the next quarter
+    still = np.ones(len(shake_times), dtype=bool)
+    for offset in np.arange(-0.5, 0.25, 0.05):
+        speed = np.linalg.norm(truth(shake_times + offset + 0.05) - truth(shake_times + offset), axis=1)/0.05
+        still &= speed < 50
+    jitter = np.sqrt(np.mean(np.sum(shake[still]**2, axis=1))) if still.any() else np.nan
+    return rms_error, best_lag, jitter
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare pose filter lag and jitter at the controller refresh rate.")
+    parser.add_argument('--poses', help="recorded poses (.npz with 'timestamps' and 'pose_points'), synthetic motion if not given")
+    parser.add_argument('--filters', nargs='+', default=['moving_average', 'one_euro', 'kalman'])
+    parser.add_argument('--fps', type=float, default=30, help="synthetic camera rate")
+    parser.add_argument('--noise', type=float, default=1.5, help="synthetic landmark noise (px)")
+    parser.add_argument('--processing-latency', type=float, default=0.02, help="seconds from capture until a pose reaches the controller")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.poses:
+        recording = np.load(args.poses)
+        found = recording['pose_points'][:, 0] != -1
+        timestamps = recording['timestamps'][found]
+        points = recording['pose_points'][found]
+        # no ground truth for a recording, compare against the raw poses
+        truth = lambda t: np.stack([np.interp(t, timestamps, points[:, 0]), np.interp(t, timestamps, points[:, 1])], axis=1)
+    else:
+        (timestamps, points) = syntheticPoses(20, args.fps, args.noise, args.seed)
+        truth = syntheticTruth
+
+    tick_rate = face_aimer_settings['mouse_refresh_rate']
+    print(f"{len(timestamps)} poses, {tick_rate} Hz controller, {args.processing_latency*1000:.0f} ms processing latency")
+    print(f"{'filter':>15} {'rms err px':>11} {'lag ms':>8} {'jitter px':>10}")
+    for filter_name in args.filters:
+        (tick_times, outputs) = simulate(makePoseFilter(filter_name), timestamps, points, tick_rate, args.processing_latency)
+        (rms_error, lag, jitter) = lagAndJitter(tick_times, outputs, truth, tick_rate)
+        print(f"{filter_name:>15} {rms_error:>11.2f} {lag*1000:>8.1f} {jitter:>10.2f}")
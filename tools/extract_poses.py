@@ -0,0 +1,124 @@
+# offline pose extraction: run the trackFace pipeline over a whole recording, split into chunks across worker processes
+# usage: python -m tools.extract_poses <clip, frame folder or .npy> <poses.npz> [--workers 4] [--chunk 900]
+# the output loads straight into tools.evaluate_pose_filters --poses
+
+import argparse
+import multiprocessing
+import os
+from time import perf_counter
+
+import cv2 as cv
+import numpy as np
+
+from settings import face_aimer_settings
+
+# read frames as fast as possible, on the calling thread, tracking in this process
+face_aimer_settings['frame_source_realtime'] = False
+face_aimer_settings['threaded_capture'] = False
+face_aimer_settings['tracking_workers'] = 0
+
+from face_aimer import faceAimer
+from frame_sources import openFrameSource
+
+# one headless aimer per worker process, built once and reused for every chunk it gets
+worker_aimer = None
+
+
+def startWorker(source):
+    global worker_aimer
+    worker_aimer = faceAimer(frame_source=source, preview_mode='headless')
+
+
+def trackChunk(chunk):
+    # tracks frames [start, end). Tracking starts fresh at least warmup frames earlier, on a frame where tracking the whole
+    # file in one go would have run a full detection too, so the roi and the solver's warm start match it by the first frame kept
+    (start, end, warmup) = chunk
+    aimer = worker_aimer
+    detect_period = aimer.tracker.redetect_interval + 1
+    first = max(0, (start - warmup)//detect_period*detect_period)
+    aimer.cap.seek(first)
+    aimer.tracker.resetTracking()
+    aimer.solver.reset()
+
+    count = end - start
+    nose_points = np.full((count, 2), -1, dtype=np.float32)
+    pose_points = np.full((count, 2), -1, dtype=np.float32)
+    rvecs = np.full((count, 3), np.nan)
+    tvecs = np.full((count, 3), np.nan)
+    landmarks = np.full((count, 68, 2), np.nan, dtype=np.float32)
+
+    for index in range(first, end):
+        ok, aimer.frame_buffer = aimer.cap.read(aimer.frame_buffer)
+        if not ok:
+            # frame count from the container was too high
+            count = index - start
+            break
+        (nose_point, pose_point) = aimer.trackFace(aimer.frame_buffer)
+        if index < start or pose_point[0] == -1:
+            continue
+        i = index - start
+        nose_points[i] = nose_point
+        pose_points[i] = pose_point
+        rvecs[i] = aimer.rot_vect.ravel()
+        tvecs[i] = aimer.trans_vect.ravel()
+        landmarks[i] = aimer.landmarks
+
+    count = max(count, 0)
+    return (start, nose_points[:count], pose_points[:count], rvecs[:count], tvecs[:count], landmarks[:count])
+
+
+def extractPoses(source, output, workers=None, chunk_frames=900, warmup_frames=None):
+    # writes the poses for every frame of source to an .npz, returns the number of frames
+    if warmup_frames is None:
+        # a full detection and a run of roi frames before the chunk starts
+        warmup_frames = face_aimer_settings['redetect_interval']
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    cap = openFrameSource(source)
+    frame_count = int(cap.get(cv.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv.CAP_PROP_FPS) or 30
+    cap.release()
+    if frame_count <= 0:
+        raise IOError(f"Can't tell how many frames {source} has")
+
+    chunks = [(start, min(start + chunk_frames, frame_count), warmup_frames) for start in range(0, frame_count, chunk_frames)]
+    workers = max(1, min(workers, len(chunks)))
+
+    tic = perf_counter()
+    if workers == 1:
+        startWorker(source)
+        results = [trackChunk(chunk) for chunk in chunks]
+    else:
+        # chunks finish out of order, they're put back in order by start frame
+        with multiprocessing.Pool(workers, initializer=startWorker, initargs=(source,)) as pool:
+            results = sorted(pool.imap_unordered(trackChunk, chunks), key=lambda result: result[0])
+    elapsed = perf_counter() - tic
+
+    (nose_points, pose_points, rvecs, tvecs, landmarks) = (np.concatenate(arrays) for arrays in list(zip(*results))[1:])
+    frame_count = len(pose_points)
+
+    # the same rotation can come out of a warm started solve 2 pi further round, keep every angle under pi so they compare
+    angles = np.linalg.norm(rvecs, axis=1, keepdims=True)
+    rvecs = np.where(angles > np.pi, rvecs*(1 - 2*np.pi/angles), rvecs)
+    found = pose_points[:, 0] != -1
+    np.savez_compressed(output, timestamps=np.arange(frame_count)/fps, nose_points=nose_points, pose_points=pose_points,
+                        rvecs=rvecs, tvecs=tvecs, landmarks=landmarks, found=found, fps=fps)
+
+    print(f"{frame_count} frames in {len(chunks)} chunks on {workers} workers, {elapsed:.1f} s: "
+          f"{frame_count/elapsed:.1f} frames/s, {frame_count/fps/elapsed:.1f}x realtime")
+    print(f"Face found in {found.mean():.1%} of frames, saved to {output}")
+    return frame_count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Extract the head pose for every frame of a recording.")
+    parser.add_argument('source', help="video file, folder of frames or .npy frame dump")
+    parser.add_argument('output', help=".npz file to write")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes, defaults to one per CPU")
+    parser.add_argument('--chunk', type=int, default=900, help="frames per chunk")
+    parser.add_argument('--warmup', type=int, default=None, help="frames tracked before each chunk to settle tracking, "
+                                                                 "defaults to redetect_interval")
+    args = parser.parse_args()
+
+    extractPoses(args.source, args.output, args.workers, args.chunk, args.warmup)
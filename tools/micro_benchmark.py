@@ -0,0 +1,180 @@
+# times individual components on synthetic inputs (or a recorded clip), no camera or OS mouse APIs needed.
+# Results are compared against a saved baseline and the run fails if a component got slower than the threshold allows
+# usage: python -m tools.micro_benchmark [--clip <clip>] [--save-baseline] [--threshold 0.25] [--only solvePnP smoothCoords]
+
+import argparse
+import json
+import os
+import timeit
+
+import cv2 as cv
+import numpy as np
+
+from frame_sources import lumaImage
+from input_controllers import mouseController, stickController
+from output_backends import recorderBackend
+from pose_channel import poseChannel
+from pose_solver import poseSolver
+from resources.facial_points_3d import model_points
+from screen_mapping import screenMapping
+
+default_baseline = 'micro_benchmark_baseline.json'
+
+
+def syntheticFrame(width=640, height=480):
+    # noise with a bright oval where a face would be, the detector finds nothing but still scans the whole frame
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    cv.ellipse(frame, (width//2, height//2), (width//8, height//5), 0, 0, 360, (180, 190, 200), -1)
+    return frame
+
+
+def cameraMatrix(width, height):
+    # same default intrinsics faceAimer uses
+    return np.array([[width, 0, width/2], [0, width, height/2], [0, 0, 1]], dtype="double")
+
+
+def syntheticLandmarks(camera_matrix):
+    # the 3d model seen from a plausible head pose, so the solver has an exact answer to find
+    rot_vect = np.array([[0.1], [-0.2], [0.05]])
+    trans_vect = np.array([[20.0], [-10.0], [600.0]])
+    (points, _) = cv.projectPoints(model_points, rot_vect, trans_vect, camera_matrix, np.zeros((4, 1)))
+    return points.reshape(-1, 2).astype(np.float32)
+
+
+def trackingComponents(frame):
+    # trackFace's stages: grayscale, face detection, landmarks. Skipped if the landmark model isn't downloaded
+    components = {}
+    gray = lumaImage(frame)
+    gray_buffer = np.empty_like(gray)
+    components['grayscale'] = lambda: lumaImage(frame, dst=gray_buffer)
+
+    try:
+        from face_tracker import faceTracker
+        tracker = faceTracker()
+    except RuntimeError as error:
+        print(f"Skipping detection & landmarks: {error}")
+        return components
+
+    components['detect'] = lambda: tracker.detectFace(gray)
+    face_box = tracker.detectFace(gray)
+    if face_box is None:
+        # no face in a synthetic frame, fit landmarks in the middle
+        import dlib
+        (height, width) = gray.shape
+        face_box = dlib.rectangle(width*3//8, height*3//10, width*5//8, height*7//10)
+    components['landmarks'] = lambda: tracker.predictLandmarks(gray, face_box)
+
+    def roiTrack():
+        # the usual frame: roi from the last frame's landmarks, no detection
+        tracker.frames_since_detect = 0
+        tracker.track(gray)
+    if tracker.track(gray) is not None:
+        components['track (roi)'] = roiTrack
+    return components
+
+
+def solverComponents(camera_matrix):
+    landmarks = syntheticLandmarks(camera_matrix)
+    solver = poseSolver(camera_matrix, np.zeros((4, 1)))
+    (rot_vect, trans_vect, _) = solver.solve(landmarks)
+    return {'solvePnP': lambda: solver.solve(landmarks),
+            'projectPoints': lambda: solver.projectPose(rot_vect, trans_vect)}
+
+
+def controllerComponents():
+    # pose space and screen like a typical calibration
+    pose_dimensions = (200, 120, (320, 240))
+    screen_mapping = screenMapping([(220, 180), (420, 180), (420, 300), (220, 300)], 2560, 1440)
+    channel = poseChannel()
+    mouse = mouseController(channel, pose_dimensions, screen_mapping, recorderBackend())
+    stick = stickController(channel, pose_dimensions, 40, recorderBackend())
+    pose_point = (390.5, 215.25)
+
+    def handoff():
+        # tracking loop to controller thread, minus the wait
+        channel.put(pose_point, 0)
+        channel.get()
+
+    return {'poseToResolution': lambda: mouse.poseToResolution(pose_point),
+            'smoothCoords': lambda: mouse.smoothCoords((1500, 700)),
+            'stick deadzone': lambda: stick.stickStrength(pose_point),
+            'pose handoff': handoff}
+
+
+def timeComponent(function, repeat):
+    # best of several runs of about 0.2 s each, in microseconds per call. The best run is the one least disturbed by everything else
+    timer = timeit.Timer(function)
+    (number, _) = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number))/number*1e6
+
+
+def runBenchmarks(clip, only, repeat):
+    frame = syntheticFrame()
+    if clip:
+        ok, recorded = cv.VideoCapture(clip).read()
+        if not ok:
+            print(f"Couldn't read {clip}, using a synthetic frame")
+        else:
+            frame = recorded
+    (height, width) = frame.shape[:2]
+
+    components = {}
+    components.update(trackingComponents(frame))
+    components.update(solverComponents(cameraMatrix(width, height)))
+    components.update(controllerComponents())
+    if only:
+        components = {name: function for (name, function) in components.items() if name in only}
+
+    results = {}
+    for (name, function) in components.items():
+        results[name] = timeComponent(function, repeat)
+    return results
+
+
+def compareBaseline(results, baseline, threshold):
+    # prints the table, returns the components that regressed
+    regressions = []
+    print(f"{'component':>18} {'us/call':>10} {'baseline':>10} {'change':>8}")
+    for (name, time_us) in results.items():
+        if name not in baseline:
+            print(f"{name:>18} {time_us:>10.2f} {'-':>10} {'-':>8}")
+            continue
+        change = time_us/baseline[name] - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSED'
+        print(f"{name:>18} {time_us:>10.2f} {baseline[name]:>10.2f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time individual components and compare them against a baseline.")
+    parser.add_argument('--clip', help="recorded clip to take a frame with a face from, synthetic frame if not given")
+    parser.add_argument('--baseline', default=default_baseline, help="baseline results file")
+    parser.add_argument('--save-baseline', action='store_true', help="save these results as the new baseline")
+    parser.add_argument('--threshold', type=float, default=0.25, help="slowdown (0.25 = 25%%) that counts as a regression")
+    parser.add_argument('--repeat', type=int, default=5, help="timing runs per component, the best is kept")
+    parser.add_argument('--only', nargs='+', help="components to run")
+    args = parser.parse_args()
+
+    results = runBenchmarks(args.clip, args.only, args.repeat)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = compareBaseline(results, baseline, args.threshold)
+
+    if args.save_baseline:
+        # keep components that weren't run this time
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=4)
+        print(f"Baseline saved to {args.baseline}")
+    elif regressions:
+        print(f"Slower than the baseline by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        exit(1)
+    elif not baseline:
+        print(f"No baseline in {args.baseline} yet, run with --save-baseline to make one")
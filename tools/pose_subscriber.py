@@ -0,0 +1,41 @@
+# reference subscriber for the pose broadcast: prints every pose face_aimer.py publishes
+# usage: python -m tools.pose_subscriber [--port 47800 | --shm face_aimer_pose]
+
+import argparse
+from time import perf_counter
+
+from pose_broadcast import shmPoseSubscriber, udpPoseSubscriber
+from settings import face_aimer_settings
+
+
+def printPoses(subscriber):
+    while True:
+        sample = subscriber.receive(timeout=1.0)
+        if sample is None:
+            print("Waiting for poses...")
+            continue
+        # capture to now, both on the machine's perf_counter clock
+        age = (perf_counter() - sample.timestamp)*1000
+        if sample.found:
+            print(f"#{sample.seq} pose ({sample.pose_point[0]:.1f}, {sample.pose_point[1]:.1f}) "
+                  f"rvec {sample.rvec.round(3)} tvec {sample.tvec.round(1)} age {age:.1f} ms")
+        else:
+            print(f"#{sample.seq} no face, age {age:.1f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Print the poses face_aimer.py broadcasts.")
+    parser.add_argument('--port', type=int, default=face_aimer_settings['pose_broadcast_port'], help="udp port to listen on")
+    parser.add_argument('--shm', default=None, help="read this shared memory slot instead of udp")
+    args = parser.parse_args()
+
+    if args.shm:
+        subscriber = shmPoseSubscriber(args.shm)
+    elif args.port:
+        subscriber = udpPoseSubscriber(args.port)
+    else:
+        parser.error("set pose_broadcast_port in settings.py, or pass --port or --shm")
+    try:
+        printPoses(subscriber)
+    except KeyboardInterrupt:
+        subscriber.close()
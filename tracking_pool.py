@@ -0,0 +1,148 @@
+import multiprocessing as mp
+import queue
+from collections import deque, namedtuple
+from multiprocessing import shared_memory
+from time import perf_counter
+
+import dlib
+import numpy as np
+
+from face_tracker import faceTracker
+
+# a worker's answer for one frame, face_box is set if the worker ran a full detection
+trackingResult = namedtuple('trackingResult', ['seq', 'slot', 'timestamp', 'worker_id', 'landmarks', 'face_box', 'busy_time'])
+
+
+def trackingWorker(worker_id, shm_name, slots_shape, task_queue, result_queue, ready):
+    # attach to the frame ring and load the models once
+    shm = shared_memory.SharedMemory(name=shm_name)
+    slots = np.ndarray(slots_shape, dtype=np.uint8, buffer=shm.buf)
+    tracker = faceTracker()
+    gray = None
+    ready.release()
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        (seq, slot, timestamp, face_box) = task
+        tic = perf_counter()
+
+        # the frame is read straight out of shared memory
+        gray = slots[slot]
+        detected_box = None
+        if face_box is None:
+            box = tracker.detectFace(gray)
+            if box is not None:
+                detected_box = (box.left(), box.top(), box.right(), box.bottom())
+        else:
+            box = dlib.rectangle(*face_box)
+        # the tracker reuses its landmark array, the queue pickles it later on its own thread
+        landmarks = tracker.predictLandmarks(gray, box).copy() if box is not None else None
+
+        result_queue.put(trackingResult(seq, slot, timestamp, worker_id, landmarks, detected_box, perf_counter() - tic))
+
+    # drop our views of the ring before detaching from it
+    del gray, slots
+    shm.close()
+
+
+class trackingPool():
+
+    def __init__(self, worker_count, frame_shape):
+        self.worker_count = worker_count
+        self.frame_shape = frame_shape
+
+        # ring of grayscale frame slots in shared memory, two per worker so the next frame can be written while one is tracked
+        slot_count = worker_count*2
+        self.shm = shared_memory.SharedMemory(create=True, size=slot_count*frame_shape[0]*frame_shape[1])
+        self.slots = np.ndarray((slot_count, frame_shape[0], frame_shape[1]), dtype=np.uint8, buffer=self.shm.buf)
+        self.free_slots = deque(range(slot_count))
+
+        # start the workers
+        self.task_queue = mp.Queue()
+        self.result_queue = mp.Queue()
+        self.ready = mp.Semaphore(0)
+        self.workers = [mp.Process(target=trackingWorker, args=(i, self.shm.name, self.slots.shape, self.task_queue, self.result_queue, self.ready), daemon=True)
+                        for i in range(worker_count)]
+        for worker in self.workers:
+            worker.start()
+
+        # result ordering
+        self.next_seq = 1
+        self.last_result_seq = 0
+
+        # pool statistics
+        self.start_time = perf_counter()
+        self.submitted_count = 0
+        self.dropped_frames = 0 # no free slot
+        self.late_results = 0 # finished after a newer frame
+        self.worker_frames = [0]*worker_count
+        self.worker_busy_time = [0]*worker_count
+
+    def waitReady(self, timeout=30):
+        # block until every worker has loaded its models, so the first frames aren't queued behind model loading
+        for _ in self.workers:
+            if not self.ready.acquire(timeout=timeout):
+                return False
+        self.start_time = perf_counter()
+        return True
+
+    def acquireSlot(self):
+        # free slot to write the next frame into, None if every slot is busy
+        if not self.free_slots:
+            self.dropped_frames += 1
+            return None
+        return self.free_slots.popleft()
+
+    def submit(self, slot, timestamp, face_box):
+        self.task_queue.put((self.next_seq, slot, timestamp, face_box))
+        self.next_seq += 1
+        self.submitted_count += 1
+
+    def results(self, timeout=0):
+        # finished results in frame order, anything finishing after a newer frame is dropped
+        finished = []
+        while True:
+            try:
+                result = self.result_queue.get(timeout=timeout) if timeout and not finished else self.result_queue.get(False)
+            except queue.Empty:
+                break
+            self.free_slots.append(result.slot)
+            self.worker_frames[result.worker_id] += 1
+            self.worker_busy_time[result.worker_id] += result.busy_time
+            finished.append(result)
+
+        in_order = []
+        for result in sorted(finished, key=lambda result: result.seq):
+            if result.seq < self.last_result_seq:
+                self.late_results += 1
+            else:
+                self.last_result_seq = result.seq
+                in_order.append(result)
+        return in_order
+
+    def inFlight(self):
+        return len(self.slots) - len(self.free_slots)
+
+    def poolStats(self):
+        elapsed = perf_counter() - self.start_time
+        stats = (f"Tracking pool: {self.worker_count} workers, {self.submitted_count} frames submitted "
+                 f"({self.submitted_count/elapsed:.1f} fps), {self.dropped_frames} dropped with no free slot, {self.late_results} late results dropped")
+        for i in range(self.worker_count):
+            busy = self.worker_busy_time[i]
+            throughput = self.worker_frames[i]/busy if busy else 0
+            stats += f"\n  worker {i}: {self.worker_frames[i]} frames, {throughput:.1f} fps while busy"
+        return stats
+
+    def close(self):
+        # stop the workers and free the shared memory
+        for _ in self.workers:
+            self.task_queue.put(None)
+        for worker in self.workers:
+            worker.join(timeout=2)
+            if worker.is_alive():
+                worker.terminate()
+        del self.slots
+        self.shm.close()
+        self.shm.unlink()